@@ -1,23 +1,34 @@
 import os
 import json
-import uuid
+import base64
+import hashlib
+import hmac
+import tempfile
 import logging
-from datetime import datetime
+import mimetypes
+from datetime import datetime, timezone
 from werkzeug.utils import secure_filename
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from werkzeug.exceptions import RequestEntityTooLarge
+from flask import Flask, Request, Response, request, g, jsonify, render_template, send_from_directory, stream_with_context
 from flask_cors import CORS
+from logging_config import configure_logging
+
+# ロガーの設定（他のモジュールがimport時に出力するログも含めるため、最初に行う）
+configure_logging()
+
 from utils import sns_client, get_character_limits
-from models import ScheduledPostDB, create_tables
+from models import ScheduledPostDB, create_tables, notify_schedule_change, jst_to_utc, remove_session, TOMBSTONE_RETENTION
 from scheduler import PostScheduler
+from validation import validate_contents, validation_error_message
+from events import event_broker, publish_event
+from build_assets import BUILD_DIR, ASSETS_DIR_NAME
+from schedule_io import PLATFORMS, build_scheduled_post, detect_format, iter_rows, iter_text_lines, import_posts, export_posts, EXPORT_FORMATS
 from dotenv import load_dotenv
 from sqlalchemy import update
 from models import ScheduledPost, engine
+from metrics import render_metrics, update_queue_metrics, update_pool_metrics, record_request_timing
+from profiling import profiler, start_timer, stop_timer, server_timing_header
 
-# ロガーの設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger("FlaskApp")
 
 # .envファイルから環境変数を読み込む
@@ -30,6 +41,39 @@ logger.info("データベーステーブルを初期化しました")
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
 CORS(app)  # CORS設定を有効に
 
+@app.teardown_appcontext
+def shutdown_session(exception=None):
+    """リクエスト終了時にデータベースセッションを解放する"""
+    remove_session()
+
+# 管理用API（/api/admin/*）の認証トークン（未設定の場合は管理用APIを無効にする）
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+@app.before_request
+def start_request_timing():
+    """リクエストの処理時間の計測と、要求されている場合はプロファイリングを開始する"""
+    start_timer()
+    g.profile = profiler.start("requests")
+
+@app.after_request
+def add_server_timing(response):
+    """処理時間をServer-Timingヘッダーに出力し、ルートごとのメトリクスに記録する"""
+    timer = stop_timer()
+    if timer is not None:
+        response.headers['Server-Timing'] = server_timing_header(timer)
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        record_request_timing(route, request.method, timer)
+    return response
+
+@app.teardown_request
+def finish_request_profile(exception=None):
+    """プロファイリング中のリクエストの計測結果を保存する（例外で終了した場合を含む）"""
+    stop_timer()
+    profile = g.pop('profile', None)
+    if profile is not None:
+        path = profiler.stop(profile, "requests", f"{request.method}-{request.path}")
+        logger.info("リクエストのプロファイルを保存しました: %s", path)
+
 # Flaskの秘密鍵を設定
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "default_secret_key")
 
@@ -42,30 +86,202 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # 許可するファイル拡張子
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'webp'}
 
+# ファイル種別ごとのアップロードサイズの上限（バイト）
+MAX_IMAGE_BYTES = int(os.getenv("UPLOAD_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+MAX_GIF_BYTES = int(os.getenv("UPLOAD_MAX_GIF_BYTES", str(15 * 1024 * 1024)))
+MAX_VIDEO_BYTES = int(os.getenv("UPLOAD_MAX_VIDEO_BYTES", str(200 * 1024 * 1024)))
+UPLOAD_SIZE_LIMITS = {
+    'png': MAX_IMAGE_BYTES,
+    'jpg': MAX_IMAGE_BYTES,
+    'jpeg': MAX_IMAGE_BYTES,
+    'webp': MAX_IMAGE_BYTES,
+    'gif': MAX_GIF_BYTES,
+    'mp4': MAX_VIDEO_BYTES,
+    'mov': MAX_VIDEO_BYTES,
+}
+
+# 1回のリクエストで送信できるサイズの上限（最大4ファイル分）。超える場合はボディを読む前に413を返す
+# ファイルごとの上限は受信中に確認する（UploadSpool）
+app.config['MAX_CONTENT_LENGTH'] = 4 * max(UPLOAD_SIZE_LIMITS.values())
+
 # ファイル拡張子のチェック関数
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+class UploadTooLarge(RequestEntityTooLarge):
+    """アップロード中のファイルが種別ごとの上限を超えた"""
+
+
+class UploadSpool:
+    """受信中のアップロードファイルを一時ファイルに直接書き込む
+
+    マルチパートのボディを解析しながら書き込むため、ファイルは一度だけディスクに書き込まれる。
+    書き込みながらSHA-256を計算し、種別ごとの上限を超えた時点でボディの受信を中断する。
+    """
+
+    def __init__(self, filename):
+        self.filename = secure_filename(filename or '')
+        extension = filename.rsplit('.', 1)[1].lower() if filename and '.' in filename else ''
+        # 許可されていない形式のファイルは保存しないため、内容を書き込まない
+        self.max_bytes = UPLOAD_SIZE_LIMITS.get(extension)
+        self.digest = hashlib.sha256()
+        self.size = 0
+        fd, self.tmp_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], suffix='.part')
+        self.file = os.fdopen(fd, 'w+b')
+
+    def write(self, data):
+        if self.max_bytes is None:
+            return len(data)
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(
+                f"ファイル {self.filename} のファイルサイズが上限（{self.max_bytes // (1024 * 1024)}MB）を超えています"
+            )
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def save(self, extension):
+        """内容のハッシュ名で保存し、(保存先のパス, ファイルサイズ, SHA-256ハッシュ) を返す
+
+        同じ内容のファイルが既にある場合は新しく保存せず、既存のファイルを使う。
+        """
+        self.file.close()
+        content_hash = self.digest.hexdigest()
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{content_hash}.{extension}")
+        if os.path.exists(file_path):
+            # 同じ内容のファイルが保存済み
+            os.remove(self.tmp_path)
+        else:
+            os.replace(self.tmp_path, file_path)
+        return file_path, self.size, content_hash
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class UploadRequest(Request):
+    """/api/upload のファイルを解析しながら保存先に書き込むリクエスト
+
+    標準ではファイル全体を一時ファイルに受信してから処理するため、上限の確認と保存で
+    二度書き込むことになり、上限を超えるファイルも最後まで受信してしまう。
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint != 'upload_media':
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        spool = UploadSpool(filename)
+        self.upload_spools = getattr(self, 'upload_spools', []) + [spool]
+        return spool
+
+
+app.request_class = UploadRequest
+
+@app.teardown_request
+def discard_upload_spools(exception=None):
+    """保存しなかったアップロードの一時ファイルを削除する"""
+    for spool in getattr(request, 'upload_spools', []):
+        spool.discard()
+
+# SNSクライアントをバックグラウンドで準備する
+if os.getenv("SNS_CLIENT_WARM_UP", "1") == "1":
+    sns_client.start_warm_up()
+
+# 他のワーカーが発行したイベントをPostgreSQLのLISTEN/NOTIFYで受け取る
+if os.getenv("EVENTS_PG_NOTIFY", "1") == "1":
+    event_broker.start_listener(engine)
+
 # 投稿スケジューラーを起動
 scheduler = PostScheduler()
 scheduler.start()
 
+# ビルド済みの静的ファイル（build_assets.py）がある場合はハッシュ付き・圧縮済みのファイルを配信する
+ASSETS_BUILT = os.path.exists(os.path.join(BUILD_DIR, 'index.html'))
+# ハッシュ付きのファイルは内容が変わるとURLも変わるため、無期限にキャッシュさせる
+CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_CONTROL_INDEX = "no-cache"
+# 配信する圧縮形式（優先する順）
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+def send_precompressed(directory, filename, cache_control):
+    """クライアントが対応している形式で事前に圧縮したファイルを返す（圧縮したファイルがない場合は元のファイル）"""
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+        if request.accept_encodings.quality(encoding) and os.path.isfile(os.path.join(directory, filename + suffix)):
+            response = send_from_directory(directory, filename + suffix, mimetype=mimetype)
+            if response.status_code != 304:
+                response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    return response
+
 @app.route('/')
 def index():
     """フロントエンドのindex.htmlを返す"""
+    if ASSETS_BUILT:
+        return send_precompressed(BUILD_DIR, 'index.html', CACHE_CONTROL_INDEX)
     return send_from_directory('../frontend', 'index.html')
 
+@app.route(f'/{ASSETS_DIR_NAME}/<path:filename>')
+def built_asset(filename):
+    """ビルド済みのハッシュ付きの静的ファイルを返す"""
+    return send_precompressed(os.path.join(BUILD_DIR, ASSETS_DIR_NAME), filename, CACHE_CONTROL_IMMUTABLE)
+
+# ポーリングされるAPIのCache-Control（ETagで変更を確認してからキャッシュを使わせる）
+CACHE_CONTROL_REVALIDATE = "private, no-cache"
+CACHE_CONTROL_CHARACTER_LIMITS = "public, max-age=3600"
+
+def make_etag(*parts):
+    """値からETagを作成する"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+def not_modified(etag, cache_control):
+    """クライアントのキャッシュ（If-None-Match）が最新の場合は304のレスポンスを返す（それ以外はNone）"""
+    if not request.if_none_match.contains(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def with_etag(response, etag, cache_control):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
 @app.route('/api/platforms', methods=['GET'])
 def get_platforms():
     """利用可能なプラットフォームの一覧と文字数制限を返す"""
-    platforms = {
-        "bluesky": {"enabled": "bluesky" in sns_client.clients, "limit": get_character_limits()["bluesky"]},
-        "x": {"enabled": "x" in sns_client.clients, "limit": get_character_limits()["x"]},
-        "threads": {"enabled": "threads" in sns_client.clients, "limit": get_character_limits()["threads"]},
-        "misskey": {"enabled": "misskey" in sns_client.clients, "limit": get_character_limits()["misskey"]},
-        "mastodon": {"enabled": "mastodon" in sns_client.clients, "limit": get_character_limits()["mastodon"]}
-    }
-    return jsonify(platforms)
+    platforms = {}
+    for platform in ["bluesky", "x", "threads", "misskey", "mastodon"]:
+        # クライアントの作成を待たずに現在の状態を返す
+        state = sns_client.clients.state(platform)
+        platforms[platform] = {
+            "enabled": state not in ("unconfigured", "failed"),
+            "state": state,
+            "limit": get_character_limits()[platform]
+        }
+
+    etag = make_etag(platforms)
+    return not_modified(etag, CACHE_CONTROL_REVALIDATE) or with_etag(jsonify(platforms), etag, CACHE_CONTROL_REVALIDATE)
+
+def invalid_contents_response(posts, has_media=False):
+    """投稿内容が文字数の上限などを満たさない場合は400のレスポンスを返す（問題がなければNone）
+
+    送信してからSNSに拒否されるとAPIの利用枠を消費するため、送信前に予約時と同じ検証を行う。
+    """
+    results = validate_contents(posts, has_media=has_media)
+    error = validation_error_message(results)
+    if error is None:
+        return None
+    return jsonify({"success": False, "error": error, "validation": results}), 400
 
 @app.route('/api/post', methods=['POST'])
 def post_to_sns():
@@ -96,11 +312,15 @@ def post_to_sns():
     if not posts:
         return jsonify({"success": False, "error": "投稿先のSNSが選択されていません"}), 400
 
+    invalid = invalid_contents_response(posts)
+    if invalid:
+        return invalid
+
     # 各プラットフォームに投稿
     try:
-        results = sns_client.post_to_platforms(posts)
+        results = sns_client.post_to_platforms(posts, interactive=True)
     except Exception as e:
-        logger.error(f"投稿処理中に予期せぬエラーが発生しました: {e}")
+        logger.error("投稿処理中に予期せぬエラーが発生しました: %s", e)
         return jsonify({"success": False, "error": f"投稿処理中にエラーが発生しました: {str(e)}"}), 500
 
     # 全体の成功・失敗を判定
@@ -111,6 +331,14 @@ def post_to_sns():
         "results": results
     })
 
+@app.errorhandler(413)
+def request_entity_too_large(error):
+    """リクエストサイズが上限を超えた場合のエラーを返す"""
+    if isinstance(error, UploadTooLarge):
+        logger.warning("アップロードサイズの上限超過: %s", error.description)
+        return jsonify({"success": False, "error": error.description}), 413
+    return jsonify({"success": False, "error": "アップロードサイズが上限を超えています"}), 413
+
 @app.route('/api/upload', methods=['POST'])
 def upload_media():
     """メディアファイルをアップロードする"""
@@ -129,29 +357,28 @@ def upload_media():
             if file and allowed_file(file.filename):
                 # 安全なファイル名を生成
                 filename = secure_filename(file.filename)
-                # ユニークなファイル名を作成
-                unique_filename = f"{str(uuid.uuid4())}_{filename}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+                extension = file.filename.rsplit('.', 1)[1].lower()
 
                 try:
-                    # ファイルを保存
-                    file.save(file_path)
+                    # 受信時に書き込んだ一時ファイルを内容のハッシュ名で保存
+                    file_path, size, content_hash = file.stream.save(extension)
                     uploaded_file_paths.append(file_path)
 
                     # メディア情報を作成
                     media_infos.append({
                         "name": filename,
                         "path": file_path,
-                        "size": os.path.getsize(file_path),
-                        "type": file.content_type
+                        "size": size,
+                        "type": file.content_type,
+                        "sha256": content_hash
                     })
                 except Exception as e:
-                    logger.error(f"ファイルの保存中にエラーが発生しました: {e}")
+                    logger.error("ファイルの保存中にエラーが発生しました: %s", e)
                     return jsonify({"success": False, "error": f"ファイル {filename} の保存中にエラーが発生しました"}), 500
             else:
-                logger.warning(f"許可されていないファイル形式: {file.filename if file else 'None'}")
+                logger.warning("許可されていないファイル形式: %s", file.filename if file else 'None')
     except Exception as e:
-        logger.error(f"ファイルアップロード処理中にエラーが発生しました: {e}")
+        logger.error("ファイルアップロード処理中にエラーが発生しました: %s", e)
         return jsonify({"success": False, "error": f"ファイルのアップロード中にエラーが発生しました: {str(e)}"}), 500
 
     if not uploaded_file_paths:
@@ -181,14 +408,15 @@ def post_with_media():
     if not posts:
         return jsonify({"success": False, "error": "投稿先のSNSが選択されていません"}), 400
 
-    results = {}
-    for platform, content in posts.items():
-        try:
-            result = sns_client.post_with_media_to_platform(platform, content, media_files)
-            results[platform] = result
-        except Exception as e:
-            logger.error(f"プラットフォーム {platform} へのメディア付き投稿でエラー発生: {e}")
-            results[platform] = {"success": False, "error": f"投稿処理中にエラーが発生しました: {str(e)}"}
+    invalid = invalid_contents_response(posts, has_media=bool(media_files))
+    if invalid:
+        return invalid
+
+    # 各プラットフォームへ並列に投稿
+    results = sns_client.post_to_platforms(posts, media_files, interactive=True)
+    for platform, result in results.items():
+        if not result.get("success"):
+            logger.error("プラットフォーム %s へのメディア付き投稿でエラー発生: %s", platform, result.get('error'))
 
     # 全体の成功・失敗を判定
     all_success = all(result.get("success", False) for result in results.values())
@@ -206,100 +434,274 @@ def schedule_post():
     if not data:
         return jsonify({"success": False, "error": "データが送信されていません"}), 400
 
-    scheduled_time = data.get('scheduled_time')
-    if not scheduled_time:
-        return jsonify({"success": False, "error": "予約時間が指定されていません"}), 400
-
     # 予約時間のログ出力
-    logger.info(f"受信した予約時間: {scheduled_time}")
-
-    # 投稿モードを取得
-    post_mode = data.get('post_mode', 'unified')
-    logger.info(f"投稿モード: {post_mode}")
-
-    # 投稿コンテンツを取得
-    content = ""
-    if post_mode == 'unified':
-        # 一括モードの場合、共通のコンテンツを使用
-        content = data.get('content', "")
-        logger.info(f"一括モードのコンテンツ: {content[:50]}...")
-    else:
-        # 個別モードの場合、プラットフォームごとのコンテンツを辞書として保存
-        content = {}
-        for platform in ["bluesky", "x", "threads", "misskey", "mastodon"]:
-            if platform in data and data[platform].get("selected"):
-                content[platform] = data[platform].get("content", "")
-                logger.info(f"個別モード: {platform}のコンテンツ: {content[platform][:50]}...")
-
-    # プラットフォーム情報を取得
-    platforms = {}
-    for platform in ["bluesky", "x", "threads", "misskey", "mastodon"]:
-        if platform in data and data[platform].get("selected"):
-            # プラットフォーム情報にコンテンツを明示的に含める
-            platform_content = data[platform].get("content", "")
-            platforms[platform] = {
-                "selected": True,
-                "content": platform_content
-            }
-            logger.info(f"{platform}のプラットフォーム情報を設定: コンテンツ長 {len(platform_content)}")
-
-    if not platforms:
-        return jsonify({"success": False, "error": "投稿先のSNSが選択されていません"}), 400
+    logger.info("受信した予約時間: %s, 投稿モード: %s", data.get('scheduled_time'), data.get('post_mode', 'unified'))
 
-    # メディアファイル情報
-    media_paths = {"files": data.get('media_files', [])} if 'media_files' in data else None
+    try:
+        post = build_scheduled_post(data)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
 
     # 予約投稿をデータベースに保存
     db = ScheduledPostDB()
 
-    post_id = db.add_scheduled_post(
-        content=content,
-        platforms=platforms,
-        scheduled_time=scheduled_time,
-        media_paths=media_paths,
-        post_mode=post_mode
-    )
+    try:
+        post_id = db.add_scheduled_post(**post)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
 
     return jsonify({
         "success": True,
         "message": "投稿が予約されました",
         "post_id": post_id,
-        "scheduled_time": scheduled_time
+        "scheduled_time": post["scheduled_time"]
+    })
+
+# 一括予約で1回のリクエストに含められる投稿数の上限
+SCHEDULE_BULK_MAX_POSTS = int(os.getenv("SCHEDULE_BULK_MAX_POSTS", "5000"))
+
+@app.route('/api/schedule/bulk', methods=['POST'])
+def schedule_posts_bulk():
+    """複数の投稿をまとめて予約する
+
+    リクエストの posts には /api/schedule と同じ形式の投稿を配列で指定する。
+    不正な投稿を除いた投稿を1つのトランザクションで保存し、投稿ごとの結果を入力順に返す。
+    """
+    data = request.json
+    posts = data.get('posts') if isinstance(data, dict) else None
+
+    if not isinstance(posts, list) or not posts:
+        return jsonify({"success": False, "error": "予約する投稿が送信されていません"}), 400
+    if len(posts) > SCHEDULE_BULK_MAX_POSTS:
+        return jsonify({
+            "success": False,
+            "error": f"一度に予約できる投稿は{SCHEDULE_BULK_MAX_POSTS}件までです"
+        }), 400
+
+    results = []
+    valid_posts = []
+    for index, item in enumerate(posts):
+        try:
+            valid_posts.append(build_scheduled_post(item))
+            results.append({"index": index, "success": True})
+        except ValueError as e:
+            results.append({"index": index, "success": False, "error": str(e)})
+
+    db = ScheduledPostDB()
+    try:
+        post_ids = iter(db.add_scheduled_posts(valid_posts))
+    except Exception as e:
+        logger.error("一括予約の保存エラー: %s", e)
+        return jsonify({"success": False, "error": f"予約投稿の保存に失敗しました: {str(e)}"}), 500
+    for result in results:
+        if result["success"]:
+            result["post_id"] = next(post_ids)
+
+    logger.info("一括予約: %s件を作成、%s件はエラー", len(valid_posts), len(posts) - len(valid_posts))
+
+    return jsonify({
+        "success": len(valid_posts) == len(posts),
+        "created": len(valid_posts),
+        "failed": len(posts) - len(valid_posts),
+        "results": results
+    })
+
+@app.route('/api/schedule/import', methods=['POST'])
+def import_scheduled_posts():
+    """CSV / JSONLファイルの予約投稿をインポートする
+
+    ファイルは1行ずつ読み込んで一定件数ごとに保存し、保存するたびに進捗をJSONLで返す。
+    最後の行（done: true）がインポートの結果になる。
+    """
+    file = request.files.get('file')
+    if not file:
+        return jsonify({"success": False, "error": "ファイルが送信されていません"}), 400
+
+    fmt = request.form.get('format') or detect_format(file.filename)
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"success": False, "error": f"対応していない形式です: {fmt}"}), 400
+
+    def generate():
+        db = ScheduledPostDB()
+        rows = iter_rows(iter_text_lines(file.stream), fmt)
+        progress = None
+        try:
+            for progress in import_posts(db, rows, fmt):
+                yield json.dumps({
+                    "processed": progress["processed"],
+                    "created": progress["created"],
+                    "failed": progress["failed"]
+                }) + "\n"
+        except Exception as e:
+            logger.error("予約投稿のインポートエラー: %s", e)
+            yield json.dumps({"done": True, "success": False, "error": str(e)}, ensure_ascii=False) + "\n"
+            return
+
+        logger.info("予約投稿をインポートしました: 作成 %s件, エラー %s件", progress['created'], progress['failed'])
+        yield json.dumps({"done": True, "success": progress["failed"] == 0, **progress}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/schedule/export', methods=['GET'])
+def export_scheduled_posts():
+    """予約投稿をCSV / JSONLファイルとしてストリーミングでエクスポートする"""
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"success": False, "error": f"対応していない形式です: {fmt}"}), 400
+
+    status = request.args.get('status')
+    if status and status not in SCHEDULED_POST_STATUSES:
+        return jsonify({"success": False, "error": f"不明なステータスです: {status}"}), 400
+
+    db = ScheduledPostDB()
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(export_posts(db, fmt, status=status)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=scheduled_posts.{fmt}"}
+    )
+
+# 予約投稿一覧の1ページあたりの件数
+SCHEDULED_POSTS_DEFAULT_LIMIT = 50
+SCHEDULED_POSTS_MAX_LIMIT = 200
+
+# 予約投稿のステータス
+SCHEDULED_POST_STATUSES = {'pending', 'processing', 'retrying', 'completed', 'failed'}
+
+def encode_cursor(cursor):
+    """(scheduled_time, id) のカーソルをURLで扱える文字列に変換する"""
+    scheduled_time, post_id = cursor
+    return base64.urlsafe_b64encode(f"{scheduled_time.isoformat()}|{post_id}".encode()).decode()
+
+def parse_cursor_time(value):
+    """カーソルの日時を解釈する（タイムゾーンのない日時はUTCの日時と比較できないためValueError）"""
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        raise ValueError(f"カーソルの日時にタイムゾーンがありません: {value}")
+    return timestamp
+
+def decode_cursor(value):
+    """encode_cursorで作成したカーソル文字列を (scheduled_time, id) に戻す"""
+    scheduled_time, post_id = base64.urlsafe_b64decode(value.encode()).decode().split('|')
+    return parse_cursor_time(scheduled_time), int(post_id)
+
+def encode_sync_cursor(cursor):
+    """変更分の同期のカーソル（投稿と削除の記録それぞれの (時刻, id)）をURLで扱える文字列に変換する"""
+    parts = [f"{timestamp.isoformat()}|{key}" for timestamp, key in cursor]
+    return base64.urlsafe_b64encode('|'.join(parts).encode()).decode()
+
+def decode_sync_cursor(value):
+    """encode_sync_cursorで作成したカーソル文字列を元に戻す"""
+    posts_time, post_id, deleted_time, deleted_id = base64.urlsafe_b64decode(value.encode()).decode().split('|')
+    return (
+        (parse_cursor_time(posts_time), int(post_id)),
+        (parse_cursor_time(deleted_time), int(deleted_id))
+    )
+
+def get_scheduled_post_changes(since, limit):
+    """?since= で指定したカーソル以降に変更・削除された予約投稿を返す"""
+    if any(request.args.get(name) for name in ('cursor', 'status', 'platform', 'from', 'to')):
+        return jsonify({"success": False, "error": "sinceは他の絞り込みと併用できません"}), 400
+
+    try:
+        cursor = decode_sync_cursor(since)
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"success": False, "error": "カーソルの形式が正しくありません"}), 400
+
+    # 削除の記録が残っていない期間の変更は同期できないため、一覧の再取得を求める
+    if cursor[1][0] < datetime.now(timezone.utc) - TOMBSTONE_RETENTION:
+        return jsonify({"success": False, "error": "カーソルの有効期限が切れています。一覧を再取得してください"}), 410
+
+    db = ScheduledPostDB()
+    try:
+        posts, deleted, next_cursor, has_more = db.get_changes_since(cursor, limit=limit)
+    except Exception as e:
+        return jsonify({"success": False, "error": f"変更分の取得に失敗しました: {str(e)}"}), 500
+
+    response = jsonify({
+        "success": True,
+        "posts": posts,
+        "deleted": deleted,
+        "next_cursor": encode_sync_cursor(next_cursor),
+        "has_more": has_more
     })
+    response.headers['Cache-Control'] = CACHE_CONTROL_REVALIDATE
+    return response
+
+def parse_time_param(value):
+    """クエリパラメータの日時を解釈する
+
+    タイムゾーンの指定がない場合はJSTとして扱う。末尾のZは（parse_scheduled_timeと異なり）UTCとして扱う。
+    +09:00 のようなオフセットはURLエンコード（%2B09:00）が必要（+ は空白として届くため400になる）。
+    """
+    return jst_to_utc(datetime.fromisoformat(value.replace('Z', '+00:00')))
 
 @app.route('/api/scheduled-posts', methods=['GET'])
 def get_scheduled_posts():
-    """予約済み投稿の一覧を取得する"""
-    db = ScheduledPostDB()
-    posts = db.get_all_scheduled_posts()
+    """予約済み投稿の一覧を取得する
+
+    クエリパラメータ:
+        limit: 1ページの件数（最大200）
+        cursor: 前のレスポンスのnext_cursor
+        status: ステータスによる絞り込み
+        platform: 投稿先プラットフォームによる絞り込み
+        from / to: 予約時間の範囲（fromを含み、toを含まない）。ISO 8601形式で、タイムゾーンの指定が
+                   ない場合はJST、末尾のZはUTC。オフセットの + は %2B にエンコードすること
+        since: 前のレスポンスのsync_cursor（または変更分のnext_cursor）。指定すると、それ以降に
+               追加・更新された投稿（posts）と削除された投稿のID（deleted）のみを返す
+    """
+    limit = request.args.get('limit', SCHEDULED_POSTS_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, SCHEDULED_POSTS_MAX_LIMIT))
+
+    if request.args.get('since'):
+        return get_scheduled_post_changes(request.args['since'], limit)
+
+    status = request.args.get('status')
+    if status and status not in SCHEDULED_POST_STATUSES:
+        return jsonify({"success": False, "error": f"不正なステータス: {status}"}), 400
+
+    platform = request.args.get('platform')
+    if platform and platform not in ["bluesky", "x", "threads", "misskey", "mastodon"]:
+        return jsonify({"success": False, "error": f"未対応のプラットフォーム: {platform}"}), 400
 
-    # JSONデータをデコード
-    for post in posts:
-        if 'platforms' in post:
-            try:
-                if isinstance(post['platforms'], str):
-                    post['platforms'] = json.loads(post['platforms'])
-            except:
-                logger.error(f"プラットフォーム情報のJSONデコードに失敗: ID={post.get('id')}")
+    try:
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"success": False, "error": "カーソルの形式が正しくありません"}), 400
 
-        if 'content' in post:
-            try:
-                if isinstance(post['content'], str):
-                    post['content'] = json.loads(post['content'])
-            except:
-                pass  # 文字列の場合そのまま
+    try:
+        start_time = parse_time_param(request.args['from']) if request.args.get('from') else None
+        end_time = parse_time_param(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"success": False, "error": "日時の形式が正しくありません"}), 400
 
-        if 'media_paths' in post and post['media_paths']:
-            try:
-                if isinstance(post['media_paths'], str):
-                    post['media_paths'] = json.loads(post['media_paths'])
-            except:
-                pass
+    db = ScheduledPostDB()
+    try:
+        # 一覧が変わっていなければ投稿を読み込まずに304を返す
+        etag = make_etag(db.get_posts_version(), request.query_string.decode())
+        response = not_modified(etag, CACHE_CONTROL_REVALIDATE)
+        if response:
+            return response
+
+        posts, next_cursor = db.get_scheduled_posts_page(
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            platform=platform,
+            start_time=start_time,
+            end_time=end_time
+        )
+    except Exception as e:
+        return jsonify({"success": False, "error": f"予約投稿の取得に失敗しました: {str(e)}"}), 500
 
-    return jsonify({
+    response = jsonify({
         "success": True,
-        "posts": posts
+        "posts": posts,
+        "next_cursor": encode_cursor(next_cursor) if next_cursor else None,
+        # 以降の変更分を ?since= で取得するためのカーソル
+        "sync_cursor": encode_sync_cursor(db.get_sync_cursor())
     })
+    return with_etag(response, etag, CACHE_CONTROL_REVALIDATE)
 
 @app.route('/api/delete-scheduled-post/<int:post_id>', methods=['DELETE'])
 def delete_scheduled_post(post_id):
@@ -315,7 +717,140 @@ def delete_scheduled_post(post_id):
 @app.route('/api/character_limits', methods=['GET'])
 def character_limits():
     """各SNSの文字数制限を返す"""
-    return jsonify(get_character_limits())
+    limits = get_character_limits()
+    etag = make_etag(limits)
+    return not_modified(etag, CACHE_CONTROL_CHARACTER_LIMITS) or with_etag(
+        jsonify(limits), etag, CACHE_CONTROL_CHARACTER_LIMITS
+    )
+
+@app.route('/api/validate', methods=['POST'])
+def validate_drafts():
+    """投稿の下書きを各SNSの数え方で検証する
+
+    リクエストの drafts には /api/schedule と同じ形式の下書きを配列で指定する（1件の場合は下書きをそのまま送信できる）。
+    """
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "error": "データが送信されていません"}), 400
+
+    drafts = data['drafts'] if 'drafts' in data else [data]
+    if not isinstance(drafts, list) or not drafts:
+        return jsonify({"success": False, "error": "検証する下書きが送信されていません"}), 400
+    if len(drafts) > SCHEDULE_BULK_MAX_POSTS:
+        return jsonify({
+            "success": False,
+            "error": f"一度に検証できる下書きは{SCHEDULE_BULK_MAX_POSTS}件までです"
+        }), 400
+
+    results = []
+    for index, draft in enumerate(drafts):
+        if not isinstance(draft, dict):
+            results.append({"index": index, "valid": False, "error": "下書きの形式が正しくありません"})
+            continue
+
+        contents = {
+            platform: draft[platform].get("content", "")
+            for platform in PLATFORMS
+            if isinstance(draft.get(platform), dict) and draft[platform].get("selected")
+        }
+        if not contents:
+            results.append({"index": index, "valid": False, "error": "投稿先のSNSが選択されていません"})
+            continue
+
+        platforms = validate_contents(contents, has_media=bool(draft.get('media_files')))
+        results.append({
+            "index": index,
+            "valid": all(result["valid"] for result in platforms.values()),
+            "platforms": platforms
+        })
+
+    return jsonify({
+        "success": True,
+        "valid": all(result["valid"] for result in results),
+        "results": results
+    })
+
+# SSEの接続を維持するためにコメント行を送る間隔（秒）
+EVENTS_HEARTBEAT_SECONDS = 15
+
+@app.route('/api/events', methods=['GET'])
+def events():
+    """予約投稿の変更をServer-Sent Eventsで配信する
+
+    イベントの種類: post_created, posts_created, post_claimed, delivery_updated,
+    post_status, post_updated, post_deleted, resync（取りこぼしがあったため一覧を再取得する）
+    各接続はワーカーのスレッドを1つ占有するため、gunicornではgthreadなどのワーカーを使うこと。
+    """
+    def stream():
+        subscriber = event_broker.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if subscriber.overflowed:
+                    subscriber.drain()
+                    yield "event: resync\ndata: {}\n\n"
+
+                event = subscriber.get(timeout=EVENTS_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                data = json.dumps(event["data"], ensure_ascii=False, default=str)
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+        finally:
+            event_broker.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        # nginxなどのプロキシでバッファリングさせない
+        "X-Accel-Buffering": "no"
+    })
+
+def is_admin_request():
+    """リクエストに管理用のトークン（Authorization: Bearer）が指定されているか確認する"""
+    if not ADMIN_TOKEN:
+        return False
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+@app.route('/api/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """次のN件のリクエスト・スケジューラーの処理をcProfileで計測する
+
+    POSTのJSON:
+        target: requests（APIリクエスト）または scheduler（スケジューラーの処理）
+        count: 計測する件数（0で取り消す）
+    GETは残りの件数と保存したプロファイルの一覧を返す。
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({"success": False, "error": "管理用APIは無効です（ADMIN_TOKENが設定されていません）"}), 404
+    if not is_admin_request():
+        return jsonify({"success": False, "error": "認証に失敗しました"}), 401
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        count = data.get('count', 1)
+        if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+            return jsonify({"success": False, "error": "countには0以上の整数を指定してください"}), 400
+        try:
+            profiler.arm(data.get('target', 'requests'), count)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        logger.info("プロファイリングを設定しました: %s %s件", data.get('target', 'requests'), count)
+
+    return jsonify({"success": True, **profiler.status()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus形式でメトリクスを返す"""
+    try:
+        status_counts, due_count = ScheduledPostDB().get_queue_stats()
+        update_queue_metrics(status_counts, due_count)
+    except Exception as e:
+        logger.error("キュー状態のメトリクス更新エラー: %s", e)
+    update_pool_metrics(engine.pool)
+
+    payload, content_type = render_metrics()
+    return Response(payload, content_type=content_type)
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
@@ -334,7 +869,7 @@ def force_check_scheduled():
 
         # スケジューラーの_scheduler_loop関数の一部を直接実行
         for post in pending_posts:
-            logger.info(f"強制処理: 予約投稿ID={post['id']}, 時間={post['scheduled_time']}")
+            logger.info("強制処理: 予約投稿ID=%s, 時間=%s", post['id'], post['scheduled_time'])
 
             # 投稿データの準備
             try:
@@ -353,16 +888,16 @@ def force_check_scheduled():
                         post_data[platform] = platform_content
 
                 if not post_data:
-                    logger.error(f"投稿先のプラットフォームが選択されていません: ID={post['id']}")
+                    logger.error("投稿先のプラットフォームが選択されていません: ID=%s", post['id'])
                     db.update_post_status(post['id'], 'failed')
                     continue
 
                 # 実際の投稿はスキップして、ステータスのみ更新（テスト用）
                 db.update_post_status(post['id'], 'completed')
-                logger.info(f"強制処理完了: ID={post['id']}")
+                logger.info("強制処理完了: ID=%s", post['id'])
 
             except Exception as e:
-                logger.error(f"強制処理エラー: {e}")
+                logger.error("強制処理エラー: %s", e)
                 db.update_post_status(post['id'], 'failed')
 
         return jsonify({
@@ -372,7 +907,7 @@ def force_check_scheduled():
         })
 
     except Exception as e:
-        logger.error(f"強制チェックエラー: {e}")
+        logger.error("強制チェックエラー: %s", e)
         return jsonify({
             "success": False,
             "error": str(e)
@@ -383,17 +918,16 @@ def force_check_scheduled():
 def set_post_now(post_id):
     """指定された投稿の予約時間を現在時刻に設定する（テスト用）"""
     try:
-        logger.info(f"投稿ID {post_id} の予約時間を現在時刻に設定")
+        logger.info("投稿ID %s の予約時間を現在時刻に設定", post_id)
 
         # 現在時刻を取得
-        now = datetime.now().isoformat()
+        now = datetime.now(timezone.utc)
 
         # データベースに接続
         db = ScheduledPostDB()
 
         # 投稿を取得
-        posts = db.get_all_scheduled_posts()
-        post = next((p for p in posts if p['id'] == post_id), None)
+        post = db.get_scheduled_post(post_id)
 
         if not post:
             return jsonify({
@@ -401,20 +935,19 @@ def set_post_now(post_id):
                 "error": f"投稿ID {post_id} が見つかりません"
             }), 404
 
-        # SQLAlchemyを使って直接投稿のscheduled_timeを更新
-        conn = engine.connect()
-        stmt = update(ScheduledPost).where(ScheduledPost.id == post_id).values(scheduled_time=now)
-        conn.execute(stmt)
-        conn.commit()
-        conn.close()
+        # SQLAlchemyを使って直接投稿のscheduled_timeを更新（イベントは同じトランザクションで発行する）
+        db.session.execute(update(ScheduledPost).where(ScheduledPost.id == post_id).values(scheduled_time=now))
+        publish_event("post_updated", session=db.session, id=post_id, scheduled_time=now.isoformat())
+        db.session.commit()
+        notify_schedule_change(now)
 
         return jsonify({
             "success": True,
-            "message": f"投稿ID {post_id} の予約時間を {now} に更新しました"
+            "message": f"投稿ID {post_id} の予約時間を {now.isoformat()} に更新しました"
         })
 
     except Exception as e:
-        logger.error(f"投稿時間更新エラー: {e}")
+        logger.error("投稿時間更新エラー: %s", e)
         return jsonify({
             "success": False,
             "error": str(e),
@@ -423,136 +956,45 @@ def set_post_now(post_id):
 # 管理用API: 予約投稿を即時に実行する（デバッグ用）
 @app.route('/api/debug/execute-scheduled-post/<int:post_id>', methods=['POST'])
 def execute_scheduled_post(post_id):
-    """指定された予約投稿を即時に実行する（デバッグ用）"""
+    """指定された予約投稿を即時に実行する（デバッグ用）
+
+    スケジューラーと同じくリースを取って投稿するため、スケジューラーと重複して投稿することはなく、
+    配信済みのプラットフォームには再投稿しない。SNSへの投稿はレート制限を通して行う。
+    """
     try:
-        logger.info(f"投稿ID {post_id} の即時実行を開始")
+        logger.info("投稿ID %s の即時実行を開始", post_id)
 
         # データベースに接続
         db = ScheduledPostDB()
 
-        # 投稿を取得
-        posts = db.get_all_scheduled_posts()
-        post = next((p for p in posts if p['id'] == post_id), None)
-
+        # 投稿を確保
+        post = db.claim_post(post_id, scheduler.owner, lease_seconds=scheduler.lease_seconds)
         if not post:
-            return jsonify({
-                "success": False,
-                "error": f"投稿ID {post_id} が見つかりません"
-            }), 404
-
-        # 投稿データの準備
-        try:
-            # 詳細なログ出力
-            logger.info(f"投稿データ: {post}")
-
-            # JSONデータのデコード
-            platforms = json.loads(post['platforms']) if isinstance(post['platforms'], str) else post['platforms']
-            content = post['content']
-            post_mode = post.get('post_mode', 'unified')
-
-            logger.info(f"投稿モード: {post_mode}")
-            logger.info(f"プラットフォーム情報: {platforms}")
-            logger.info(f"コンテンツ情報: {content if isinstance(content, str) else 'オブジェクト'}")
-
-            # メディアパスを取得（存在する場合）
-            media_paths = None
-            if post.get('media_paths'):
-                media_paths = json.loads(post['media_paths']) if isinstance(post['media_paths'], str) else post['media_paths']
-                logger.info(f"メディア情報: {media_paths}")
-
-            # 投稿するプラットフォームの準備
-            post_data = {}
-            for platform, platform_content in platforms.items():
-                if isinstance(platform_content, dict) and platform_content.get('selected'):
-                    post_data[platform] = platform_content
-                    logger.info(f"{platform}が選択されています: {platform_content}")
-
-            if not post_data:
+            if db.get_scheduled_post(post_id) is None:
                 return jsonify({
                     "success": False,
-                    "error": "投稿先のプラットフォームが選択されていません"
-                }), 400
-
-            # 各プラットフォームへの投稿実行
-            results = {}
-            success = True
-
-            for platform, platform_data in post_data.items():
-                try:
-                    # プラットフォームごとのコンテンツ取得
-                    platform_content = None
-
-                    # データから直接コンテンツを取得
-                    if isinstance(platform_data, dict) and 'content' in platform_data:
-                        platform_content = platform_data['content']
-                        logger.info(f"プラットフォーム情報から直接コンテンツを取得: {platform} -> {platform_content[:50]}...")
-                    # 個別投稿モードの場合
-                    elif post_mode == 'individual' and isinstance(content, dict) and platform in content:
-                        platform_content = content[platform]
-                        logger.info(f"個別モードからコンテンツを取得: {platform} -> {platform_content[:50]}...")
-                    # 一括投稿モードの場合
-                    elif post_mode == 'unified':
-                        if isinstance(content, str):
-                            platform_content = content
-                        elif isinstance(content, dict) and 'text' in content:
-                            platform_content = content['text']
-                        else:
-                            platform_content = str(content)
-                        logger.info(f"一括モードからコンテンツを取得: {platform} -> {platform_content[:50]}...")
-
-                    if not platform_content or not platform_content.strip():
-                        error_msg = f"プラットフォーム {platform} のコンテンツが空です"
-                        logger.error(error_msg)
-                        results[platform] = {"success": False, "error": error_msg}
-                        success = False
-                        continue
-
-                    # メディア付き投稿または通常投稿
-                    if media_paths and media_paths.get('files'):
-                        result = sns_client.post_with_media_to_platform(
-                            platform,
-                            platform_content,
-                            media_paths['files']
-                        )
-                    else:
-                        result = sns_client.post_to_platform(platform, platform_content)
-
-                    results[platform] = result
-
-                    if not result.get('success'):
-                        logger.error(f"プラットフォーム {platform} への投稿に失敗: {result.get('error')}")
-                        success = False
-                    else:
-                        logger.info(f"プラットフォーム {platform} への投稿に成功")
-
-                except Exception as e:
-                    error_msg = f"プラットフォーム {platform} への投稿でエラー発生: {e}"
-                    logger.error(error_msg)
-                    results[platform] = {"success": False, "error": error_msg}
-                    success = False
-
-            # 投稿状態の更新
-            final_status = 'completed' if success else 'failed'
-            db.update_post_status(post['id'], final_status)
-            logger.info(f"投稿ID {post['id']} の状態を {final_status} に更新しました")
+                    "error": f"投稿ID {post_id} が見つかりません"
+                }), 404
+            return jsonify({
+                "success": False,
+                "error": f"投稿ID {post_id} は処理中です"
+            }), 409
 
+        # スケジューラーと同じ処理で未配信のプラットフォームに投稿し、配信記録と投稿状態を更新する
+        final_status, results = scheduler.process_post(post)
+        if final_status is None:
             return jsonify({
-                "success": success,
-                "message": "投稿処理が完了しました",
-                "status": final_status,
-                "results": results
-            })
-
-        except json.JSONDecodeError as e:
-            error_msg = f"JSONデコードエラー: {e}"
-            logger.error(error_msg)
-            db.update_post_status(post['id'], 'failed')
-            return jsonify({"success": False, "error": error_msg}), 500
-        except Exception as e:
-            error_msg = f"投稿処理中の予期せぬエラー: {e}"
-            logger.error(error_msg)
-            db.update_post_status(post['id'], 'failed')
-            return jsonify({"success": False, "error": error_msg}), 500
+                "success": False,
+                "error": f"投稿ID {post_id} は他のワーカーが処理中です"
+            }), 409
+        logger.info("投稿ID %s の状態を %s に更新しました", post_id, final_status)
+
+        return jsonify({
+            "success": final_status == 'completed',
+            "message": "投稿処理が完了しました",
+            "status": final_status,
+            "results": results
+        })
 
     except Exception as e:
         error_msg = f"投稿実行エラー: {e}"
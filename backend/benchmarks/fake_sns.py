@@ -0,0 +1,244 @@
+"""ベンチマーク用の偽SNSサーバー
+
+Threads Graph API・Mastodon・Misskey・X・Bluesky（XRPC）の投稿に使うAPIを真似たHTTPサーバー。
+応答の遅延、エラー（HTTP 500）の割合、レート制限（HTTP 429）の割合を指定できる。
+SnsClientは環境変数（THREADS_API_BASE_URL, BLUESKY_BASE_URL, X_API_BASE_URL,
+MISSKEY_INSTANCE_URL, MASTODON_INSTANCE_URL）で接続先をこのサーバーに向ける。
+
+単体で起動する場合（backendディレクトリで実行）:
+    python benchmarks/fake_sns.py --latency-ms 200 --rate-limit-rate 0.05
+"""
+import json
+import time
+import base64
+import random
+import argparse
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PLATFORMS = ("bluesky", "x", "threads", "misskey", "mastodon")
+
+
+def _fake_jwt(subject, lifetime=24 * 3600):
+    """署名を検証しないクライアント向けのJWT（Blueskyのセッション用）"""
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+    now = int(time.time())
+    payload = {"sub": subject, "scope": "com.atproto.access", "iat": now, "exp": now + lifetime}
+    return f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode(payload)}.{encode('signature')}"
+
+
+class FakeSnsConfig:
+    """偽サーバーの応答の設定"""
+
+    def __init__(self, latency_ms=100.0, jitter_ms=20.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+
+class FakeSnsServer:
+    """1つのプラットフォームを真似る偽サーバー（別スレッドで動作する）"""
+
+    def __init__(self, platform, config, host="127.0.0.1", port=0):
+        self.platform = platform
+        self.config = config
+        self.ids = itertools.count(1)
+        self.stats = {"requests": 0, "posts": 0, "errors": 0, "rate_limited": 0}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name=f"fake-{self.platform}")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def next_id(self):
+        with self.lock:
+            return str(next(self.ids))
+
+    def route(self, method, path):
+        """(ステータスコード, 応答, 障害を注入するか) を返す"""
+        path = path.split("?")[0].rstrip("/")
+
+        if self.platform == "threads":
+            if method == "GET" and path.endswith("/me"):
+                return 200, {"id": "bench-user"}, False
+            if method == "POST" and path.endswith("/threads_publish"):
+                return 200, {"id": self.next_id()}, True
+            if method == "POST" and path.endswith("/threads"):
+                return 200, {"id": self.next_id()}, True
+
+        elif self.platform == "mastodon":
+            if method == "GET" and path in ("/api/v1/instance", "/api/v2/instance"):
+                return 200, {"uri": "localhost", "title": "fake", "version": "4.2.0"}, False
+            if method == "POST" and path == "/api/v1/statuses":
+                return 200, {"id": self.next_id(), "visibility": "public"}, True
+            if method == "POST" and path in ("/api/v1/media", "/api/v2/media"):
+                return 200, {"id": self.next_id(), "type": "image"}, True
+
+        elif self.platform == "misskey":
+            if method == "POST" and path == "/api/i":
+                return 200, {"id": "bench-user", "username": "bench"}, False
+            if method == "POST" and path == "/api/notes/create":
+                return 200, {"createdNote": {"id": self.next_id()}}, True
+            if method == "POST" and path == "/api/drive/files/create":
+                return 200, {"id": self.next_id()}, True
+
+        elif self.platform == "x":
+            if method == "POST" and path == "/2/tweets":
+                return 201, {"data": {"id": self.next_id(), "text": ""}}, True
+            if method == "POST" and path == "/1.1/media/upload.json":
+                media_id = self.next_id()
+                return 200, {"media_id": int(media_id), "media_id_string": media_id}, True
+
+        elif self.platform == "bluesky":
+            did = "did:plc:bench"
+            if path in ("/xrpc/com.atproto.server.createSession", "/xrpc/com.atproto.server.refreshSession"):
+                return 200, {
+                    "did": did, "handle": "bench.test",
+                    "accessJwt": _fake_jwt(did), "refreshJwt": _fake_jwt(did, 90 * 24 * 3600)
+                }, False
+            if path == "/xrpc/com.atproto.server.getSession":
+                return 200, {"did": did, "handle": "bench.test"}, False
+            if path == "/xrpc/app.bsky.actor.getProfile":
+                return 200, {"did": did, "handle": "bench.test"}, False
+            if path == "/xrpc/com.atproto.repo.createRecord":
+                return 200, {"uri": f"at://{did}/app.bsky.feed.post/{self.next_id()}", "cid": "bafybench"}, True
+            if path == "/xrpc/com.atproto.repo.uploadBlob":
+                return 200, {"blob": {
+                    "$type": "blob", "ref": {"$link": "bafybench"}, "mimeType": "image/png", "size": 1
+                }}, True
+
+        return 404, {"error": "NotFound", "message": f"{method} {path}"}, False
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                server.count("requests")
+
+                status, body, faulty = server.route(method, self.path)
+                config = server.config
+                headers = {}
+                if faulty:
+                    delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+                    time.sleep(max(delay, 0) / 1000)
+                    roll = random.random()
+                    if roll < config.rate_limit_rate:
+                        server.count("rate_limited")
+                        status, body = 429, {"error": "RateLimitExceeded", "message": "Too Many Requests"}
+                        headers["Retry-After"] = str(config.retry_after)
+                    elif roll < config.rate_limit_rate + config.error_rate:
+                        server.count("errors")
+                        status, body = 500, {"error": "InternalServerError", "message": "fake error"}
+                    else:
+                        server.count("posts")
+
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def start_fake_servers(config, platforms=PLATFORMS):
+    """プラットフォームごとに偽サーバーを起動し、{platform: FakeSnsServer} を返す"""
+    return {platform: FakeSnsServer(platform, config).start() for platform in platforms}
+
+
+def client_environment(servers):
+    """SnsClientを偽サーバーに向けるための環境変数を返す"""
+    env = {}
+    if "bluesky" in servers:
+        env.update(BLUESKY_USERNAME="bench.test", BLUESKY_PASSWORD="bench",
+                   BLUESKY_BASE_URL=f"{servers['bluesky'].url}/xrpc")
+    if "x" in servers:
+        env.update(X_API_KEY="bench", X_API_SECRET="bench", X_ACCESS_TOKEN="bench",
+                   X_ACCESS_TOKEN_SECRET="bench", X_API_BASE_URL=servers["x"].url)
+    if "threads" in servers:
+        env.update(THREADS_ACCESS_TOKEN="bench", THREADS_API_BASE_URL=f"{servers['threads'].url}/v1.0")
+    if "misskey" in servers:
+        env.update(MISSKEY_API_TOKEN="bench", MISSKEY_INSTANCE_URL=servers["misskey"].url)
+    if "mastodon" in servers:
+        env.update(MASTODON_ACCESS_TOKEN="bench", MASTODON_INSTANCE_URL=servers["mastodon"].url)
+    return env
+
+
+def add_config_arguments(parser):
+    """偽サーバーの設定のコマンドライン引数を追加する"""
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="投稿APIの応答の遅延（ミリ秒）")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="遅延のばらつき（ミリ秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="HTTP 500を返す割合（0〜1）")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="HTTP 429を返す割合（0〜1）")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="HTTP 429のRetry-After（秒）")
+
+
+def config_from_args(args):
+    return FakeSnsConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用の偽SNSサーバーを起動する")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    servers = start_fake_servers(config_from_args(args))
+    for name, value in client_environment(servers).items():
+        print(f"{name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers.values():
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
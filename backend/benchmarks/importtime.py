@@ -0,0 +1,73 @@
+"""起動時のimport時間を計測するスクリプト
+
+`python -X importtime` でモジュールをimportし、累積時間の大きい順にレポートを表示する。
+各SNSのSDKがimport時に読み込まれている場合や、合計時間が上限を超えた場合は終了コード1を返す。
+
+使い方（backendディレクトリで実行）:
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --module app --budget-ms 1500
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 初回使用時まで読み込まないSNSのSDK
+DEFERRED_PACKAGES = ("atproto", "tweepy", "mastodon", "misskey", "cloudinary")
+
+
+def measure_import_time(module):
+    """モジュールのimport時間を計測し、(自身の時間[us], 累積時間[us], モジュール名) のリストを返す"""
+    env = dict(os.environ, SNS_CLIENT_WARM_UP="0")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{module} のimportに失敗しました:\n{completed.stderr}")
+
+    records = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        records.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時のimport時間を計測する")
+    parser.add_argument("--module", default="utils", help="計測するモジュール（デフォルト: utils）")
+    parser.add_argument("--top", type=int, default=20, help="表示する件数")
+    parser.add_argument("--budget-ms", type=float, default=None, help="合計import時間の上限（ミリ秒）")
+    args = parser.parse_args()
+
+    records = measure_import_time(args.module)
+    total_ms = sum(self_us for self_us, _, _ in records) / 1000
+
+    print(f"{args.module} のimport時間: {total_ms:.1f}ms（{len(records)}モジュール）")
+    print(f"{'累積[ms]':>10} {'自身[ms]':>10}  モジュール")
+    for self_us, cumulative_us, name in sorted(records, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>10.1f} {self_us / 1000:>10.1f}  {name}")
+
+    failed = False
+    imported = {name.strip().split(".")[0] for _, _, name in records}
+    eager_packages = [package for package in DEFERRED_PACKAGES if package in imported]
+    if eager_packages:
+        print(f"起動時にSDKが読み込まれています: {', '.join(eager_packages)}")
+        failed = True
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"import時間が上限を超えています: {total_ms:.1f}ms > {args.budget_ms:.1f}ms")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""フロントエンドの静的ファイルのビルド（ファイル名のハッシュ付与と事前圧縮）
+
+frontend/ のCSS・JavaScript・画像を内容のハッシュを含むファイル名（script.<hash>.js）で
+frontend/dist/assets/ にコピーし、gzip（.gz）とBrotli（.br）で圧縮したファイルも作成する。
+index.htmlはハッシュ付きのファイル名を参照するように書き換えて frontend/dist/ に保存する。
+
+app.pyは frontend/dist/index.html がある場合にビルドしたファイルを配信する。ハッシュ付きの
+ファイルは内容が変わるとファイル名も変わるため、ブラウザに無期限でキャッシュさせられる。
+Brotliで圧縮するには Brotli パッケージが必要（インストールされていない場合はgzipのみ作成する）。
+
+使い方（backendディレクトリで実行）:
+    python build_assets.py
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend")
+BUILD_DIR = os.path.join(FRONTEND_DIR, "dist")
+# ハッシュ付きのファイルを配信するURLのパス（BUILD_DIR内のディレクトリ名と同じ）
+ASSETS_DIR_NAME = "assets"
+
+# 圧縮するファイルの拡張子（画像などは圧縮済みのため除く）
+COMPRESSIBLE_EXTENSIONS = (".html", ".css", ".js", ".svg", ".json", ".txt")
+# これより小さいファイルは圧縮しない（ヘッダーの分だけ大きくなるため）
+MIN_COMPRESS_BYTES = 256
+HASH_LENGTH = 10
+
+# index.htmlのhref・src属性（外部のURLや絶対パスは書き換えない）
+ASSET_REFERENCE_PATTERN = re.compile(r'(\b(?:href|src)=")([^":?#]+)(")')
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def fingerprinted_name(path, data):
+    """ファイル名に内容のハッシュを付ける（img/favicon.svg → img/favicon.<hash>.svg）"""
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{fingerprint(data)}{extension}"
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def write_compressed(path, data):
+    """gzip・Brotliで圧縮したファイルを作成する（元のファイルより小さくならない場合は作成しない）"""
+    if not path.endswith(COMPRESSIBLE_EXTENSIONS) or len(data) < MIN_COMPRESS_BYTES:
+        return []
+
+    # mtime=0 にして、同じ内容からは同じ .gz が作成されるようにする
+    encoded = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded[".br"] = brotli.compress(data, quality=11)
+
+    written = []
+    for suffix, compressed in encoded.items():
+        if len(compressed) < len(data):
+            write_file(path + suffix, compressed)
+            written.append(suffix)
+    return written
+
+
+def iter_source_files(source_dir, build_dir):
+    """ハッシュを付けるファイルの source_dir からの相対パスを返す（index.htmlとビルド先は除く）"""
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(
+            d for d in dirs
+            if not d.startswith(".") and os.path.abspath(os.path.join(root, d)) != os.path.abspath(build_dir)
+        )
+        for name in sorted(files):
+            if name.startswith("."):
+                continue
+            path = os.path.relpath(os.path.join(root, name), source_dir)
+            if path != "index.html":
+                yield path.replace(os.sep, "/")
+
+
+def rewrite_references(html, manifest):
+    """index.htmlが参照するファイルをハッシュ付きのファイル名に置き換える"""
+    def replace(match):
+        path = match.group(2)
+        hashed = manifest.get(path[2:] if path.startswith("./") else path)
+        if hashed is None:
+            return match.group(0)
+        return f"{match.group(1)}{ASSETS_DIR_NAME}/{hashed}{match.group(3)}"
+
+    return ASSET_REFERENCE_PATTERN.sub(replace, html)
+
+
+def build(source_dir=FRONTEND_DIR, build_dir=BUILD_DIR):
+    """静的ファイルをビルドし、{元のファイル名: ハッシュ付きのファイル名} を返す"""
+    if os.path.exists(build_dir):
+        shutil.rmtree(build_dir)
+    assets_dir = os.path.join(build_dir, ASSETS_DIR_NAME)
+
+    manifest = {}
+    for path in iter_source_files(source_dir, build_dir):
+        with open(os.path.join(source_dir, path), "rb") as f:
+            data = f.read()
+        hashed = fingerprinted_name(path, data)
+        output = os.path.join(assets_dir, hashed)
+        write_file(output, data)
+        write_compressed(output, data)
+        manifest[path] = hashed
+
+    with open(os.path.join(source_dir, "index.html"), encoding="utf-8") as f:
+        html = rewrite_references(f.read(), manifest).encode("utf-8")
+    index_path = os.path.join(build_dir, "index.html")
+    write_file(index_path, html)
+    write_compressed(index_path, html)
+
+    with open(os.path.join(build_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="フロントエンドの静的ファイルにハッシュを付けて圧縮する")
+    parser.add_argument("--source", default=FRONTEND_DIR, help="フロントエンドのディレクトリ")
+    parser.add_argument("--output", default=BUILD_DIR, help="ビルド先のディレクトリ（既存の内容は削除される）")
+    args = parser.parse_args()
+
+    manifest = build(args.source, args.output)
+    for path, hashed in manifest.items():
+        print(f"{path} -> {ASSETS_DIR_NAME}/{hashed}")
+    if brotli is None:
+        print("Brotliがインストールされていないため、gzipのみ作成しました", file=sys.stderr)
+    print(f"{len(manifest)}件のファイルを {args.output} にビルドしました")
+
+
+if __name__ == "__main__":
+    main()
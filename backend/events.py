@@ -0,0 +1,181 @@
+"""予約投稿の変更イベントの配信（/api/events のServer-Sent Events）
+
+APIハンドラーとスケジューラーはpublish_eventでイベントを発行し、プロセス内のブローカーが
+購読中のSSE接続に配信する。PostgreSQLのLISTEN/NOTIFYを有効にすると、イベントは一度NOTIFYで
+送信され、全てのプロセス（gunicornの各ワーカー）のリスナーが受け取って自プロセスの購読者に配信する。
+
+データの変更と同じセッションを渡した場合、NOTIFYはそのトランザクション内で送信され、
+コミットされた時点で配信される（ロールバックした場合は配信されない）。
+"""
+import os
+import json
+import time
+import queue
+import select
+import logging
+import threading
+import itertools
+from sqlalchemy import text, event
+
+logger = logging.getLogger("EventBroker")
+
+# NOTIFYのチャンネル名
+EVENTS_CHANNEL = "sns_poster_events"
+# 購読者ごとに溜めておけるイベント数（溢れた場合は一覧の再取得を促す）
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "1000"))
+# LISTEN用の接続が切れた場合に再接続するまでの間隔（秒）
+LISTENER_RETRY_SECONDS = 5
+
+
+class Subscriber:
+    """1つのSSE接続が受け取るイベントのキュー"""
+
+    def __init__(self, max_size=EVENTS_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=max_size)
+        # キューが溢れてイベントを取りこぼした場合はTrue
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """次のイベントを返す（timeout秒以内に届かなければNone）"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        """取りこぼしを通知する前に溜まっているイベントを破棄する"""
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.overflowed = False
+
+
+class EventBroker:
+    """イベントを購読中のSSE接続に配信するプロセス内のブローカー"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        # LISTEN/NOTIFYを使う場合のエンジン（Noneの場合はプロセス内のみで配信する）
+        self.engine = None
+        self.listener = None
+
+    def subscribe(self):
+        subscriber = Subscriber()
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish_local(self, event):
+        """このプロセスの購読者にイベントを配信する"""
+        event = dict(event, id=next(self.ids))
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    def publish(self, event_type, session=None, **data):
+        """イベントを発行する（LISTEN/NOTIFYが有効な場合は全プロセスに配信される）
+
+        sessionを指定した場合は、そのトランザクションがコミットされた時点で配信する。
+        """
+        event = {"type": event_type, "data": data}
+        notify = self.engine is not None and self.listener is not None and self.listener.is_alive()
+        if session is not None:
+            if notify:
+                # 追加のコネクションを使わず、データの変更と同じトランザクションで送信する
+                session.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": EVENTS_CHANNEL, "payload": json.dumps(event, default=str)}
+                )
+            else:
+                session.info.setdefault("pending_events", []).append(event)
+            return
+
+        if notify:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(
+                        text("SELECT pg_notify(:channel, :payload)"),
+                        {"channel": EVENTS_CHANNEL, "payload": json.dumps(event, default=str)}
+                    )
+                return
+            except Exception as e:
+                logger.error("イベントのNOTIFYに失敗しました（このプロセスのみに配信します）: %s", e)
+        self.publish_local(event)
+
+    def watch_sessions(self, session_factory):
+        """セッションのコミット時に、プロセス内のみで配信するイベントを配信する"""
+        event.listen(session_factory, "after_commit", self._after_commit)
+        event.listen(session_factory, "after_rollback", self._after_rollback)
+
+    def _after_commit(self, session):
+        for pending in session.info.pop("pending_events", []):
+            self.publish_local(pending)
+
+    def _after_rollback(self, session):
+        session.info.pop("pending_events", None)
+
+    def start_listener(self, engine):
+        """他のプロセスが発行したイベントをLISTENで受け取るスレッドを開始する"""
+        self.engine = engine
+        self.listener = threading.Thread(target=self._listen, name="event-listener")
+        self.listener.daemon = True
+        self.listener.start()
+
+    def _listen(self):
+        import psycopg2
+
+        # コネクションプールの接続を占有しないよう、LISTEN専用の接続を作成する
+        dsn = self.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(dsn)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {EVENTS_CHANNEL}")
+                logger.info("イベントのLISTENを開始しました")
+
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.publish_local(json.loads(notify.payload))
+                        except ValueError:
+                            logger.error("不正なイベントを受信しました: %s", notify.payload[:100])
+            except Exception as e:
+                logger.error("イベントのLISTENでエラーが発生しました: %s", e)
+                # 接続し直すまでの間に発生したイベントは取りこぼすため、購読者に再取得を促す
+                with self.lock:
+                    for subscriber in self.subscribers:
+                        subscriber.overflowed = True
+            finally:
+                if conn is not None:
+                    conn.close()
+            time.sleep(LISTENER_RETRY_SECONDS)
+
+
+# イベントブローカーのインスタンス
+event_broker = EventBroker()
+
+
+def publish_event(event_type, session=None, **data):
+    """イベントを発行する（sessionを指定した場合はそのトランザクションのコミット時に配信する）"""
+    event_broker.publish(event_type, session=session, **data)
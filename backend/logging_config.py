@@ -0,0 +1,160 @@
+"""ログの設定
+
+ログはQueueHandlerでキューに入れるだけにして、出力（JSONへの変換・書き込み）はQueueListenerの
+スレッドで行う。投稿の処理中のスレッドがログの出力を待たされないようにするため。
+メッセージの組み立て（msg % args）は、引数のオブジェクトが後で変更されないよう呼び出し元のスレッドで行う。
+
+  LOG_LEVEL:  出力するログのレベル（デフォルト: INFO）
+  LOG_FORMAT: json（1行1レコードのJSON）または text（デフォルト: json）
+
+投稿ごと・プラットフォームごとに出力するログは sampled_logger で取得したロガーを使い、
+同じメッセージが短時間に大量に出力される場合は一定数を超えた分を間引く。
+"""
+import os
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import datetime
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+# .envファイルから環境変数を読み込む
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# 出力待ちのログの上限（溢れた場合は破棄して件数を記録する）
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# sampled_loggerのログは、同じメッセージをLOG_SAMPLE_INTERVAL秒ごとにLOG_SAMPLE_BURST件まで出力する
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "10"))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# LogRecordが標準で持つ属性（これ以外はextraで渡された値としてJSONに含める）
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """ログを1行のJSONに変換する"""
+
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and not key.startswith("_"):
+                data[key] = value
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        elif record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """ログをキューに入れるだけのハンドラー（キューが一杯の場合は待たずに破棄する）"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # msg % args と例外のトレースバックはここで文字列にする（引数のオブジェクトはListenerのスレッドで
+        # 組み立てるまでに変更されたり、ORMのオブジェクトのようにセッションの終了後に使えなくなる場合がある）。
+        # ハンドラーのフォーマット（JSONへの変換）は標準のQueueHandlerと異なりListenerのスレッドで行う
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # 破棄した件数は、次にキューに入れたログの dropped 属性に記録する
+        with self.dropped_lock:
+            dropped = self.dropped
+            if dropped:
+                record.dropped = dropped
+            try:
+                self.queue.put_nowait(record)
+                self.dropped -= dropped
+            except queue.Full:
+                self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """同じメッセージのログをinterval秒ごとにburst件まで通し、超えた分を間引く
+
+    間引いた件数は、次に出力するログの suppressed 属性に記録する。
+    """
+
+    def __init__(self, interval=LOG_SAMPLE_INTERVAL, burst=LOG_SAMPLE_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            started, count, suppressed = self.windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                started, count = now, 0
+            if count >= self.burst:
+                self.windows[key] = (started, count, suppressed + 1)
+                return False
+            self.windows[key] = (started, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+def configure_logging(level=None, fmt=None):
+    """プロセス全体のログの出力先を設定する（2回目以降の呼び出しでは何もしない）"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+
+        handler = logging.StreamHandler()
+        if (fmt or LOG_FORMAT) == "json":
+            handler.setFormatter(JsonFormatter())
+        else:
+            handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(NonBlockingQueueHandler(log_queue))
+        root.setLevel(level or LOG_LEVEL)
+
+        _listener = QueueListener(log_queue, handler)
+        _listener.start()
+        # 終了時にキューに残ったログを出力する
+        atexit.register(_listener.stop)
+
+
+def sampled_logger(name):
+    """同じメッセージを短時間に大量に出力すると間引かれるロガーを返す（投稿ごとのログ用）"""
+    logger = logging.getLogger(name)
+    if not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter())
+    return logger
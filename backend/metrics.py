@@ -0,0 +1,110 @@
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Prometheus形式で公開するメトリクス（/metricsエンドポイントで出力する）
+# 値はプロセスごとに集計されるため、gunicornの複数ワーカーで集計する場合は
+# PROMETHEUS_MULTIPROC_DIRを設定してprometheus_clientのマルチプロセスモードを使用する
+
+# SNSへの投稿の所要時間
+POST_LATENCY = Histogram(
+    "sns_post_duration_seconds",
+    "SNSへの投稿にかかった時間（メディアのアップロードを含む）",
+    ["platform", "media"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+
+# メディアのアップロードの所要時間（キャッシュを使用した場合は含まない）
+MEDIA_UPLOAD_LATENCY = Histogram(
+    "sns_media_upload_duration_seconds",
+    "メディアのアップロードにかかった時間",
+    ["platform"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+# 投稿の成功・失敗数
+POSTS_TOTAL = Counter(
+    "sns_posts_total",
+    "SNSへの投稿数",
+    ["platform", "status"]
+)
+POST_ERRORS_TOTAL = Counter(
+    "sns_post_errors_total",
+    "SNSへの投稿の失敗数（エラーの種類別）",
+    ["platform", "error_class"]
+)
+
+# レート制限（HTTP 429）を受けた回数
+RATE_LIMIT_HITS = Counter(
+    "sns_rate_limit_hits_total",
+    "SNSからレート制限を受けた回数",
+    ["platform"]
+)
+
+# 予約投稿のキューの状態
+SCHEDULED_POSTS = Gauge(
+    "scheduled_posts",
+    "ステータスごとの予約投稿数",
+    ["status"]
+)
+DUE_POSTS = Gauge(
+    "scheduled_posts_due",
+    "予約時間を過ぎても未処理（pending）の予約投稿数"
+)
+
+# スケジューラーが投稿を処理した時刻と予約時間の差
+DISPATCH_LAG = Histogram(
+    "scheduler_dispatch_lag_seconds",
+    "予約時間から実際に投稿を開始するまでの遅延",
+    buckets=(1, 5, 15, 30, 60, 300, 900, 1800, 3600, 21600, 86400)
+)
+
+# APIリクエストの処理時間（total: 全体, db: SQLの実行, http: SNSのAPI呼び出しの待ち時間）
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "APIリクエストの処理時間（レスポンスのストリーミングを除く）",
+    ["route", "method", "component"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+# データベースのコネクションプール
+DB_POOL_SIZE = Gauge("db_pool_size", "コネクションプールのサイズ")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "使用中のコネクション数")
+DB_POOL_CHECKED_IN = Gauge("db_pool_checked_in", "プール内で待機中のコネクション数")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "プールサイズを超えて作成されたコネクション数")
+DB_POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "コネクションの取得回数")
+
+
+def record_post_result(platform, result, duration, media=False):
+    """SNSへの投稿結果と所要時間を記録する"""
+    POST_LATENCY.labels(platform=platform, media=str(bool(media)).lower()).observe(duration)
+    if result.get("success"):
+        POSTS_TOTAL.labels(platform=platform, status="success").inc()
+    else:
+        POSTS_TOTAL.labels(platform=platform, status="failure").inc()
+        POST_ERRORS_TOTAL.labels(platform=platform, error_class=result.get("error_class", "Error")).inc()
+
+
+def record_request_timing(route, method, timer):
+    """APIリクエストの処理時間を記録する"""
+    REQUEST_LATENCY.labels(route=route, method=method, component="total").observe(timer.elapsed())
+    for component, seconds in timer.durations.items():
+        REQUEST_LATENCY.labels(route=route, method=method, component=component).observe(seconds)
+
+
+def update_queue_metrics(status_counts, due_count):
+    """予約投稿のキューの状態を更新する"""
+    for status in ("pending", "processing", "retrying", "completed", "failed"):
+        SCHEDULED_POSTS.labels(status=status).set(status_counts.get(status, 0))
+    DUE_POSTS.set(due_count)
+
+
+def update_pool_metrics(pool):
+    """データベースのコネクションプールの状態を更新する"""
+    DB_POOL_SIZE.set(pool.size())
+    DB_POOL_CHECKED_OUT.set(pool.checkedout())
+    DB_POOL_CHECKED_IN.set(pool.checkedin())
+    DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+
+def render_metrics():
+    """Prometheusのテキスト形式でメトリクスを出力する"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,232 @@
+"""リクエスト・スケジューラーの処理時間の計測とプロファイリング
+
+処理時間の計測:
+  start_timer() から stop_timer() までの間に、同じスレッドで実行したSQLの時間（db）と
+  SNSのAPI呼び出しを待った時間（http）を集計する。app.pyはリクエストごとに計測し、
+  Server-Timingヘッダーとメトリクスに出力する。
+
+プロファイリング:
+  profiler.arm() で、次のN件のリクエストまたはスケジューラーの処理をcProfileで計測し、
+  PROFILE_DIR に pstats形式（.prof）と上位の関数の一覧（.txt）を保存する。
+  .profは snakeviz や flameprof（フレームグラフ）で表示できる。
+  cProfileは有効にしたスレッドの処理しか記録しないため、ワーカースレッドに渡す処理は
+  profiler.wrap() で包み、ワーカースレッドで計測した結果を呼び出し元の結果に合算する。
+"""
+import os
+import time
+import pstats
+import cProfile
+import datetime
+import functools
+import threading
+from contextlib import contextmanager
+
+# プロファイルの保存先
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+# 一度に計測できる件数の上限
+PROFILE_MAX_COUNT = 100
+# .txtに出力する関数の数
+PROFILE_SUMMARY_LINES = 50
+PROFILE_TARGETS = ("requests", "scheduler")
+
+_local = threading.local()
+
+
+class Timer:
+    """1つのリクエスト（スケジューラーの1回の処理）の処理時間"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {"db": 0.0, "http": 0.0}
+
+    def add(self, category, seconds):
+        self.durations[category] = self.durations.get(category, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def start_timer():
+    """このスレッドの処理時間の計測を開始する"""
+    _local.timer = Timer()
+    return _local.timer
+
+
+def current_timer():
+    return getattr(_local, "timer", None)
+
+
+def stop_timer():
+    """このスレッドの処理時間の計測を終了し、計測結果を返す（計測していない場合はNone）"""
+    timer = current_timer()
+    _local.timer = None
+    return timer
+
+
+def record_time(category, seconds):
+    """計測中の場合は処理時間を加算する"""
+    timer = current_timer()
+    if timer is not None:
+        timer.add(category, seconds)
+
+
+@contextmanager
+def timed(category):
+    """ブロックの実行時間を計測中の処理時間に加算する"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(category, time.perf_counter() - started)
+
+
+def instrument_engine(engine):
+    """SQLの実行時間を計測中の処理時間（db）に加算するイベントを登録する"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_time("db", time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # エラーになったSQLはafter_cursor_executeが呼ばれないため、開始時刻を捨てる
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            record_time("db", time.perf_counter() - started.pop())
+
+
+def server_timing_header(timer):
+    """Server-Timingヘッダーの値を返す（ミリ秒）"""
+    metrics = [f"app;dur={timer.elapsed() * 1000:.1f}"]
+    metrics.extend(
+        f"{category};dur={seconds * 1000:.1f}" for category, seconds in timer.durations.items()
+    )
+    return ", ".join(metrics)
+
+
+class Profiler:
+    """次のN件の処理をcProfileで計測するスイッチ"""
+
+    def __init__(self, output_dir=PROFILE_DIR):
+        self.output_dir = output_dir
+        self.remaining = {target: 0 for target in PROFILE_TARGETS}
+        self.lock = threading.Lock()
+        # cProfileは同時に1つしか有効にできないため、計測中の処理があれば他の処理は計測しない
+        self.active = threading.Lock()
+        # 計測中のcProfileと、wrap() した処理をワーカースレッドで計測したcProfile
+        self.current = None
+        self.children = []
+
+    def arm(self, target, count):
+        """targetの次のcount件を計測する（0で取り消す）"""
+        if target not in PROFILE_TARGETS:
+            raise ValueError(f"不明な計測対象です: {target}")
+        with self.lock:
+            self.remaining[target] = max(0, min(count, PROFILE_MAX_COUNT))
+
+    def status(self):
+        with self.lock:
+            remaining = dict(self.remaining)
+        files = []
+        if os.path.isdir(self.output_dir):
+            files = sorted(name for name in os.listdir(self.output_dir) if name.endswith(".prof"))
+        return {"remaining": remaining, "output_dir": self.output_dir, "files": files[-20:]}
+
+    def start(self, target):
+        """計測が要求されていればcProfileを開始して返す（それ以外はNone）"""
+        with self.lock:
+            if not self.remaining[target] or not self.active.acquire(blocking=False):
+                return None
+            self.remaining[target] -= 1
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 他のプロファイラーが有効な場合は計測しない
+            self.active.release()
+            return None
+        with self.lock:
+            self.current = profile
+            self.children = []
+        _local.profile = profile
+        return profile
+
+    def stop(self, profile, target, name):
+        """cProfileを終了して結果を保存する"""
+        if profile is None:
+            return None
+        try:
+            profile.disable()
+        finally:
+            _local.profile = None
+            with self.lock:
+                self.current = None
+                children, self.children = self.children, []
+            self.active.release()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name).strip("_") or "root"
+        path = os.path.join(self.output_dir, f"{target}-{timestamp}-{safe_name}")
+
+        stats = pstats.Stats(profile)
+        for child in children:
+            stats.add(child)
+        stats.dump_stats(f"{path}.prof")
+        with open(f"{path}.txt", "w") as f:
+            stats.stream = f
+            stats.sort_stats("cumulative").print_stats(PROFILE_SUMMARY_LINES)
+        return f"{path}.prof"
+
+    def wrap(self, fn):
+        """このスレッドが計測中の場合は、fnを実行したスレッドでも計測するように包んで返す
+
+        ThreadPoolExecutorに渡す関数に使う。計測中でなければfnをそのまま返す。
+        """
+        parent = getattr(_local, "profile", None)
+        if parent is None:
+            return fn
+
+        @functools.wraps(fn)
+        def profiled(*args, **kwargs):
+            # fnの中でさらに別のスレッドに渡す処理も計測する
+            previous = getattr(_local, "profile", None)
+            _local.profile = parent
+            child = cProfile.Profile()
+            try:
+                child.enable()
+            except ValueError:
+                # Python 3.12以降はcProfileをプロセス全体で1つしか有効にできない
+                # （その場合は呼び出し元のcProfileが全スレッドの処理を記録する）
+                child = None
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _local.profile = previous
+                if child is not None:
+                    child.disable()
+                    with self.lock:
+                        # 呼び出し元の計測が終了した後に完了した処理は捨てる
+                        if self.current is parent:
+                            self.children.append(child)
+
+        return profiled
+
+    @contextmanager
+    def profile(self, target, name):
+        """計測が要求されていればブロックをcProfileで計測する"""
+        profile = self.start(target)
+        try:
+            yield
+        finally:
+            self.stop(profile, target, name)
+
+
+# プロファイラーのインスタンス
+profiler = Profiler()
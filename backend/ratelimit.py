@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+from email.utils import parsedate_to_datetime
+
+# プラットフォームごとのレート制限のデフォルト値（1秒あたりのリクエスト数, バースト数）
+# 環境変数 SNS_RATE_LIMIT_<PLATFORM>="<rate>,<burst>" で上書きできる（例: SNS_RATE_LIMIT_X="0.1,3"）
+DEFAULT_RATE_LIMITS = {
+    "bluesky": (1.0, 5),
+    "x": (1 / 15, 3),
+    "threads": (0.5, 3),
+    "misskey": (1.0, 5),
+    "mastodon": (1.0, 10),
+}
+
+
+def load_rate_limits():
+    """環境変数で上書きしたレート制限の設定を返す"""
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for platform in DEFAULT_RATE_LIMITS:
+        value = os.getenv(f"SNS_RATE_LIMIT_{platform.upper()}")
+        if value:
+            rate, burst = value.split(",")
+            limits[platform] = (float(rate), int(burst))
+    return limits
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限
+
+    トークンが足りない場合も先に確保して待ち時間を返すため、同時に待っているスレッドは
+    確保した順に一定の間隔で実行される。
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """トークンを1つ確保し、使用できるまでの待ち時間（秒）を返す"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self, max_wait=None):
+        """トークンを1つ確保できるまで待機し、待機した時間（秒）を返す
+
+        max_waitを指定した場合、それより長く待つ必要があれば確保を取り消して待たずにNoneを返す。
+        """
+        wait = self.reserve()
+        if max_wait is not None and wait > max_wait:
+            self.release()
+            return None
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def release(self):
+        """reserveで確保したトークンを返す"""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def wait_time(self):
+        """次のトークンを使用できるまでの待ち時間（秒）を返す"""
+        with self.lock:
+            now = time.monotonic()
+            tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            wait = (1 - tokens) / self.rate if tokens < 1 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def block_for(self, seconds):
+        """サーバーからレート制限を通知された場合に、指定時間はトークンを払い出さない"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 0)
+
+
+class RateLimiter:
+    """プラットフォームとアカウントの組み合わせごとにトークンバケットを管理する"""
+
+    def __init__(self, limits=None):
+        self.limits = limits or load_rate_limits()
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, platform, account=None):
+        key = (platform, account)
+        with self.lock:
+            if key not in self.buckets:
+                rate, burst = self.limits.get(platform, (1.0, 5))
+                self.buckets[key] = TokenBucket(rate, burst)
+            return self.buckets[key]
+
+    def acquire(self, platform, account=None, max_wait=None):
+        return self.bucket(platform, account).acquire(max_wait)
+
+    def wait_time(self, platform, account=None):
+        return self.bucket(platform, account).wait_time()
+
+    def block_for(self, platform, seconds, account=None):
+        self.bucket(platform, account).block_for(seconds)
+
+
+def retry_after_seconds(error):
+    """レート制限（HTTP 429）のエラーから再試行までの待ち時間（秒）を返す
+
+    Retry-After、x-rate-limit-reset（X）、ratelimit-reset（Bluesky）ヘッダーに対応する。
+    レート制限によるエラーでない場合はNoneを返す。
+    """
+    # Misskeyはヘッダーではなくエラーコードでレート制限を通知する
+    if getattr(error, "code", None) == "RATE_LIMIT_EXCEEDED":
+        return 60.0
+
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(response, "status", None)
+    if status != 429:
+        return None
+
+    headers = {key.lower(): value for key, value in dict(getattr(response, "headers", None) or {}).items()}
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+
+    for header in ("x-rate-limit-reset", "ratelimit-reset"):
+        try:
+            return max(float(headers[header]) - time.time(), 0.0)
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    # 待ち時間が通知されない場合は1分待つ
+    return 60.0
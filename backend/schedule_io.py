@@ -0,0 +1,294 @@
+"""予約投稿のインポート・エクスポート（CSV / JSONL）
+
+ファイルを1行ずつ読み込み、chunk_size件ごとに1つのトランザクションで保存するため、
+ファイル全体をメモリに読み込まずに数十万件の予約投稿を移行・バックアップできる。
+
+JSONLの各行は /api/schedule と同じ形式の投稿（statusを含めることもできる）。
+CSVの列は EXPORT_CSV_COLUMNS の通りで、platformsには投稿先をスペース区切りで指定する。
+プラットフォーム名の列（bluesky, x, ...）が空の場合はcontent列の内容を投稿する。
+
+使い方（backendディレクトリで実行）:
+    python schedule_io.py import posts.csv
+    python schedule_io.py import posts.jsonl --chunk-size 5000
+    python schedule_io.py export --format jsonl --output backup.jsonl
+"""
+import io
+import os
+import sys
+import csv
+import json
+import argparse
+from models import ScheduledPostDB, create_tables, parse_scheduled_time
+from validation import validate_contents, validation_error_message
+from logging_config import configure_logging
+
+PLATFORMS = ("bluesky", "x", "threads", "misskey", "mastodon")
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_CSV_COLUMNS = ("id", "scheduled_time", "status", "post_mode", "platforms", "content") + PLATFORMS + ("media_files",)
+
+# 1つのトランザクションで保存する件数
+IMPORT_CHUNK_SIZE = 1000
+# インポート結果に含めるエラーの件数の上限
+MAX_REPORTED_ERRORS = 100
+
+# インポートしたステータスの変換（処理中・再試行待ちの投稿は未処理として取り込む）
+IMPORT_STATUSES = {
+    "pending": "pending",
+    "processing": "pending",
+    "retrying": "pending",
+    "completed": "completed",
+    "failed": "failed",
+}
+
+
+def build_scheduled_post(data):
+    """リクエストの内容から予約投稿の作成に必要な値を取り出す（不正な場合はValueError）"""
+    if not isinstance(data, dict):
+        raise ValueError("投稿データの形式が正しくありません")
+
+    scheduled_time = data.get('scheduled_time')
+    if not scheduled_time:
+        raise ValueError("予約時間が指定されていません")
+
+    # 投稿モードを取得
+    post_mode = data.get('post_mode', 'unified')
+
+    # 投稿コンテンツを取得
+    content = ""
+    if post_mode == 'unified':
+        # 一括モードの場合、共通のコンテンツを使用
+        content = data.get('content', "")
+    else:
+        # 個別モードの場合、プラットフォームごとのコンテンツを辞書として保存
+        content = {}
+        for platform in PLATFORMS:
+            if isinstance(data.get(platform), dict) and data[platform].get("selected"):
+                content[platform] = data[platform].get("content", "")
+
+    # プラットフォーム情報を取得
+    platforms = {}
+    for platform in PLATFORMS:
+        if isinstance(data.get(platform), dict) and data[platform].get("selected"):
+            # プラットフォーム情報にコンテンツを明示的に含める
+            platforms[platform] = {
+                "selected": True,
+                "content": data[platform].get("content", "")
+            }
+
+    if not platforms:
+        raise ValueError("投稿先のSNSが選択されていません")
+
+    # 予約時間の形式を保存前に確認する
+    parse_scheduled_time(scheduled_time)
+
+    # メディアファイル情報
+    media_paths = {"files": data.get('media_files', [])} if 'media_files' in data else None
+
+    # 文字数の上限を超えた投稿は予約時に拒否する（投稿時のAPI呼び出しで失敗させない）
+    error = validation_error_message(validate_contents(
+        {platform: platform_data["content"] for platform, platform_data in platforms.items()},
+        has_media=bool(media_paths and media_paths["files"])
+    ))
+    if error:
+        raise ValueError(error)
+
+    return {
+        "content": content,
+        "platforms": platforms,
+        "scheduled_time": scheduled_time,
+        "media_paths": media_paths,
+        "post_mode": post_mode
+    }
+
+
+def detect_format(filename, default="jsonl"):
+    """ファイル名の拡張子から形式（csv / jsonl）を判定する"""
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if extension in ("json", "ndjson"):
+        return "jsonl"
+    return extension if extension in EXPORT_FORMATS else default
+
+
+def iter_text_lines(binary_stream):
+    """バイナリストリームを1行ずつUTF-8の文字列として返す（先頭のBOMは除く）"""
+    first = True
+    for line in binary_stream:
+        yield line.decode("utf-8-sig" if first else "utf-8")
+        first = False
+
+
+def iter_rows(lines, fmt):
+    """テキストの行から (行番号, 行データ) を返す（CSVは辞書、JSONLは文字列）"""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(lines, start=1):
+            if line.strip():
+                yield line_number, line
+
+
+def row_to_request(row, fmt):
+    """インポートの1行を /api/schedule と同じ形式の辞書に変換する"""
+    if fmt != "csv":
+        data = json.loads(row)
+        if not isinstance(data, dict):
+            raise ValueError("JSONオブジェクトではありません")
+        return data
+
+    data = {
+        "scheduled_time": row.get("scheduled_time"),
+        "post_mode": row.get("post_mode") or "unified",
+        "content": row.get("content") or "",
+    }
+    if row.get("status"):
+        data["status"] = row["status"]
+    for platform in (row.get("platforms") or "").replace(",", " ").split():
+        if platform not in PLATFORMS:
+            raise ValueError(f"不明なプラットフォームです: {platform}")
+        data[platform] = {"selected": True, "content": row.get(platform) or data["content"]}
+    if row.get("media_files"):
+        data["media_files"] = row["media_files"].split()
+    return data
+
+
+def import_posts(db, rows, fmt, chunk_size=IMPORT_CHUNK_SIZE):
+    """予約投稿をchunk_size件ずつ保存し、保存するたびに進捗を返すジェネレーター
+
+    不正な行は読み飛ばしてエラーとして記録する。最後に返す進捗がインポートの結果になる。
+    """
+    progress = {"processed": 0, "created": 0, "failed": 0, "errors": []}
+    chunk = []
+
+    def add_error(line_number, error):
+        progress["failed"] += 1
+        if len(progress["errors"]) < MAX_REPORTED_ERRORS:
+            progress["errors"].append({"line": line_number, "error": str(error)})
+
+    for line_number, row in rows:
+        progress["processed"] += 1
+        try:
+            data = row_to_request(row, fmt)
+            post = build_scheduled_post(data)
+            status = data.get("status") or "pending"
+            if not isinstance(status, str) or status not in IMPORT_STATUSES:
+                raise ValueError(f"不明なステータスです: {status}")
+            post["status"] = IMPORT_STATUSES[status]
+            chunk.append(post)
+        except ValueError as e:
+            add_error(line_number, e)
+
+        if len(chunk) >= chunk_size:
+            progress["created"] += len(db.add_scheduled_posts(chunk))
+            chunk = []
+            yield progress
+
+    if chunk:
+        progress["created"] += len(db.add_scheduled_posts(chunk))
+    yield progress
+
+
+def post_to_export_row(post):
+    """投稿を /api/schedule と同じ形式（インポートできる形式）の辞書に変換する"""
+    row = {
+        "id": post["id"],
+        "scheduled_time": post["scheduled_time"],
+        "status": post["status"],
+        "post_mode": post["post_mode"] or "unified",
+        "content": post["content"] if isinstance(post["content"], str) else "",
+    }
+    platforms = post["platforms"] if isinstance(post["platforms"], dict) else {}
+    for platform, platform_data in platforms.items():
+        if isinstance(platform_data, dict) and platform_data.get("selected"):
+            row[platform] = {"selected": True, "content": platform_data.get("content", "")}
+    media_paths = post["media_paths"]
+    if isinstance(media_paths, dict) and media_paths.get("files"):
+        row["media_files"] = media_paths["files"]
+    return row
+
+
+def export_posts(db, fmt, status=None):
+    """予約投稿をCSV / JSONLの文字列として1件ずつ返すジェネレーター（CSVは最初にヘッダー行を返す）"""
+    posts = db.iter_scheduled_posts(status=status)
+
+    if fmt != "csv":
+        for post in posts:
+            yield json.dumps(post_to_export_row(post), ensure_ascii=False) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    yield flush()
+    for post in posts:
+        row = post_to_export_row(post)
+        selected = [platform for platform in PLATFORMS if platform in row]
+        writer.writerow(
+            [row["id"], row["scheduled_time"], row["status"], row["post_mode"], " ".join(selected), row["content"]]
+            + [row[platform]["content"] if platform in row else "" for platform in PLATFORMS]
+            + [" ".join(row.get("media_files", []))]
+        )
+        yield flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="予約投稿をCSV / JSONLでインポート・エクスポートする")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="ファイルから予約投稿をインポートする")
+    import_parser.add_argument("file", help="インポートするファイル（- で標準入力）")
+    import_parser.add_argument("--format", choices=EXPORT_FORMATS, help="ファイル形式（省略時は拡張子で判定）")
+    import_parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="1回に保存する件数")
+
+    export_parser = subparsers.add_parser("export", help="予約投稿をファイルにエクスポートする")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, default="jsonl", help="ファイル形式")
+    export_parser.add_argument("--status", help="ステータスによる絞り込み")
+    export_parser.add_argument("--output", "-o", default="-", help="出力先のファイル（省略時は標準出力）")
+    args = parser.parse_args()
+
+    configure_logging()
+    create_tables()
+    db = ScheduledPostDB()
+
+    if args.command == "import":
+        fmt = args.format or detect_format(args.file)
+        stream = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+        try:
+            rows = iter_rows(iter_text_lines(stream), fmt)
+            for progress in import_posts(db, rows, fmt, chunk_size=args.chunk_size):
+                print(f"{progress['processed']}件を処理（作成: {progress['created']}件, エラー: {progress['failed']}件）",
+                      file=sys.stderr)
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        for error in progress["errors"]:
+            print(f"{error['line']}行目: {error['error']}", file=sys.stderr)
+        sys.exit(1 if progress["failed"] else 0)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        # CSVのヘッダー行は件数に含めない
+        count = -1 if args.format == "csv" else 0
+        for chunk in export_posts(db, args.format, status=args.status):
+            output.write(chunk)
+            count += 1
+            if count and count % IMPORT_CHUNK_SIZE == 0:
+                print(f"{count}件をエクスポートしました", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"合計{count}件をエクスポートしました", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
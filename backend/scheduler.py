@@ -1,35 +1,63 @@
 import time
+import uuid
+import heapq
+import random
+import socket
 import threading
 import datetime
 import json
 import os
 import logging
-from models import ScheduledPostDB, ensure_utc, utc_to_jst
+from models import ScheduledPostDB, ensure_utc, utc_to_jst, add_schedule_listener, remove_session
 from utils import sns_client
+from metrics import DISPATCH_LAG
+from logging_config import sampled_logger
+from profiling import profiler, start_timer, stop_timer
 
-# ロガーの設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger("PostScheduler")
+# 投稿ごと・プラットフォームごとのログ（大量の投稿を処理する際は間引かれる）
+post_logger = sampled_logger("PostScheduler.posts")
+
+# 一部のプラットフォームへの投稿に失敗した場合の再試行の設定
+# 待ち時間は base * 2^(試行回数-1) を上限capで打ち切り、その半分をランダムにずらす
+RETRY_MAX_ATTEMPTS = int(os.getenv("SCHEDULER_RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("SCHEDULER_RETRY_BASE_SECONDS", "60"))
+RETRY_MAX_SECONDS = float(os.getenv("SCHEDULER_RETRY_MAX_SECONDS", "3600"))
 
 class PostScheduler:
-    def __init__(self, check_interval=3600):
+    def __init__(self, check_interval=300, batch_size=100, lease_seconds=600,
+                 max_attempts=RETRY_MAX_ATTEMPTS, retry_base=RETRY_BASE_SECONDS, retry_cap=RETRY_MAX_SECONDS):
         try:
             self.db = ScheduledPostDB()
             logger.info("スケジューラーのデータベース初期化成功")
         except Exception as e:
-            logger.error(f"スケジューラーのデータベース初期化エラー: {e}")
+            logger.error("スケジューラーのデータベース初期化エラー: %s", e)
             raise
 
-        self.check_interval = check_interval  # 1h単位で確認間隔を設定
+        # 次の予約時間までの待機の上限（他プロセスで追加された投稿を拾うための保険）
+        self.check_interval = check_interval
+        self.batch_size = batch_size  # 1回のチェックで処理する投稿数の上限
+        # 投稿を確保する際のリース期間と、このスケジューラーを識別する所有者ID
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # 失敗したプラットフォームへの再試行回数の上限と待ち時間
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
         self.running = False
         self.thread = None
 
+        # 今後の予約時間のヒープと、予約変更時に待機中のスレッドを起こすための条件変数
+        self.due_times = []
+        self.condition = threading.Condition()
+        self.reload_requested = False
+        # 予約時間の読み込み中に追加された予約時間（読み込み後のヒープに加える）
+        self.added_during_reload = None
+
     def start(self):
         if not self.running:
             self.running = True
+            add_schedule_listener(self.notify_schedule_change)
             self.thread = threading.Thread(target=self._scheduler_loop)
             self.thread.daemon = True
             self.thread.start()
@@ -37,20 +65,102 @@ class PostScheduler:
 
     def stop(self):
         self.running = False
+        with self.condition:
+            self.condition.notify()
         if self.thread:
             self.thread.join()
             logger.info("投稿スケジューラを停止しました")
 
+    def notify_schedule_change(self, scheduled_time, deleted=False):
+        """予約の追加・削除で最も早い予約時間が変わった場合にスケジューラーを起こす"""
+        scheduled_time = ensure_utc(scheduled_time)
+        with self.condition:
+            earliest = self.due_times[0] if self.due_times else None
+
+            if deleted:
+                # 先頭の予約が削除された場合は予約時間を読み込み直す
+                if earliest is not None and scheduled_time <= earliest:
+                    self.reload_requested = True
+                    self.condition.notify()
+                return
+
+            heapq.heappush(self.due_times, scheduled_time)
+            if self.added_during_reload is not None:
+                self.added_during_reload.append(scheduled_time)
+            if scheduled_time <= datetime.datetime.now(datetime.timezone.utc):
+                # 既に予約時間を過ぎている場合はヒープの読み込み直しで消えないよう即時実行を要求する
+                self.reload_requested = True
+            if earliest is None or scheduled_time < earliest:
+                self.condition.notify()
+
+    def _reload_due_times(self):
+        """データベースから今後の予約時間を読み込んでヒープを作り直す"""
+        with self.condition:
+            self.added_during_reload = []
+        try:
+            due_times = self.db.get_upcoming_times(limit=self.batch_size)
+        except Exception:
+            with self.condition:
+                self.added_during_reload = None
+            raise
+        with self.condition:
+            # 読み込み中に追加された予約時間はクエリの結果に含まれていない場合があるため、ヒープに加えておく
+            self.due_times = due_times + self.added_during_reload
+            self.added_during_reload = None
+            heapq.heapify(self.due_times)
+
+    def _wait_for_next_due(self):
+        """次の予約時間まで待機する（予約の変更があれば途中で起きる）"""
+        with self.condition:
+            while self.running and not self.reload_requested:
+                now = datetime.datetime.now(datetime.timezone.utc)
+                timeout = self.check_interval
+                if self.due_times:
+                    timeout = min(timeout, (self.due_times[0] - now).total_seconds())
+                if timeout <= 0:
+                    break
+                if not self.condition.wait(timeout):
+                    break
+            self.reload_requested = False
+
+    def _retry_delay(self, attempts):
+        """attempts回失敗した後の再試行までの待ち時間（秒）を返す"""
+        delay = min(self.retry_cap, self.retry_base * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _status_from_deliveries(self, deliveries, results):
+        """配信記録から投稿の状態と次の再試行時刻を決める
+
+        再試行までの待ち時間は、試行回数による待ち時間とプラットフォームから通知された
+        レート制限の解除までの時間（結果のretry_after）の長い方にする。
+        """
+        statuses = {delivery['status'] for delivery in deliveries.values()}
+        if statuses <= {'delivered'}:
+            return 'completed', None
+        if 'retrying' not in statuses:
+            return 'failed', None
+
+        # 失敗したプラットフォームのみ、待ち時間をおいて再試行する
+        retrying = [platform for platform, delivery in deliveries.items() if delivery['status'] == 'retrying']
+        attempts = max(deliveries[platform]['attempts'] for platform in retrying)
+        delay = self._retry_delay(max(attempts, 1))
+        retry_afters = [
+            results[platform]['retry_after'] for platform in retrying
+            if results.get(platform, {}).get('retry_after') is not None
+        ]
+        if retry_afters:
+            delay = max(delay, max(retry_afters))
+        return 'retrying', datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=delay)
+
     def _get_platform_content(self, content, platform, platform_content, post_mode):
         """プラットフォームごとの投稿コンテンツを取得する"""
         try:
-            logger.info(f"コンテンツタイプ: {type(content)}, 投稿モード: {post_mode}")
-            logger.info(f"プラットフォームコンテンツ: {platform_content}")
+            post_logger.debug("コンテンツタイプ: %s, 投稿モード: %s", type(content).__name__, post_mode)
 
             # プラットフォームのcontentがすでに文字列の場合はそのまま使用
             if isinstance(platform_content, dict) and 'content' in platform_content:
                 platform_content = platform_content['content']
-                logger.info(f"プラットフォーム情報からコンテンツを取得しました: {platform_content[:50]}...")
+                post_logger.debug("プラットフォーム情報からコンテンツを取得しました: %s文字", len(platform_content))
                 return platform_content
 
             # 個別投稿モードの場合
@@ -58,135 +168,194 @@ class PostScheduler:
                 # contentが辞書で、そのプラットフォームのキーがある場合
                 if isinstance(content, dict) and platform in content:
                     platform_content = content[platform]
-                    logger.info(f"個別モード: {platform}用のコンテンツを使用しました")
+                    post_logger.debug("個別モード: %s用のコンテンツを使用しました", platform)
                     return platform_content
             # 一括投稿モードの場合
             elif post_mode == 'unified':
                 # contentが文字列の場合
                 if isinstance(content, str):
-                    logger.info(f"一括モード: 共通コンテンツ(文字列)を使用しました")
+                    post_logger.debug("一括モード: 共通コンテンツ(文字列)を使用しました")
                     return content
                 # contentが辞書で'text'キーがある場合
                 elif isinstance(content, dict) and 'text' in content:
-                    logger.info(f"一括モード: 'text'キーからコンテンツを使用しました")
+                    post_logger.debug("一括モード: 'text'キーからコンテンツを使用しました")
                     return content['text']
                 # contentがそのまま使える場合
                 else:
-                    logger.info(f"一括モード: コンテンツを文字列化して使用しました")
+                    post_logger.debug("一括モード: コンテンツを文字列化して使用しました")
                     return str(content)
 
             # プラットフォームのコンテンツを直接取得できない場合は、platforms情報から取得する
-            logger.error(f"プラットフォーム {platform} のコンテンツが見つかりません")
+            logger.error("プラットフォーム %s のコンテンツが見つかりません", platform)
             return None
         except Exception as e:
-            logger.error(f"コンテンツ取得エラー: {e}")
+            logger.error("コンテンツ取得エラー: %s", e)
             return None
 
+    def process_post(self, post):
+        """確保した投稿を未配信のプラットフォームに投稿し、(投稿の状態, プラットフォームごとの結果) を返す
+
+        postはclaim_due_posts・claim_postで確保した投稿（このスケジューラーがリースを持っていること）。
+        リースを失っていた場合は投稿の状態を更新せず、状態としてNoneを返す。
+        """
+        post_logger.debug("スケジュールされた投稿を処理中: ID=%s, 時刻=%s", post['id'], post['scheduled_time'])
+
+        # バッチの途中でリースが切れないよう、送信の直前にリースを延長する
+        # （既に他のワーカーが再確保していた場合は、重複して投稿しないよう処理しない）
+        if not self.db.renew_lease(post['id'], self.owner, self.lease_seconds):
+            logger.warning("リースを失ったため投稿を処理しません: ID=%s", post['id'])
+            return None, {}
+
+        # 配信済み・再試行の上限に達したプラットフォームには投稿しない
+        deliveries = self.db.get_deliveries([post['id']]).get(post['id'], {})
+        # SNSへの送信中（レート制限の待ちを含む）にコネクションを保持しないよう、読み込みのトランザクションを終える
+        self.db.session.rollback()
+        if not deliveries:
+            lag = datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(post['scheduled_time'])
+            DISPATCH_LAG.observe(max(lag.total_seconds(), 0))
+
+        # 投稿データの準備
+        try:
+            # JSONデータのデコード
+            platforms = json.loads(post['platforms']) if isinstance(post['platforms'], str) else post['platforms']
+            content = post['content']
+
+            post_logger.debug("投稿プラットフォーム: %s", list(platforms.keys()))
+            post_logger.debug("投稿内容の長さ: %s", len(str(content)))
+
+            post_data = {}
+            for platform, platform_content in platforms.items():
+                if isinstance(platform_content, dict) and platform_content.get('selected'):
+                    if platform in deliveries and deliveries[platform]['status'] != 'retrying':
+                        post_logger.debug("%sへの投稿は処理済みです: %s", platform, deliveries[platform]['status'])
+                        continue
+                    post_data[platform] = platform_content
+                    post_logger.debug("%sへの投稿が選択されています", platform)
+
+            if not post_data:
+                selected = {
+                    platform: delivery for platform, delivery in deliveries.items()
+                    if isinstance(platforms.get(platform), dict) and platforms[platform].get('selected')
+                }
+                if selected:
+                    # 全てのプラットフォームの配信が記録済みで、投稿の状態の更新前に中断していた場合
+                    final_status, _ = self._status_from_deliveries(selected, {})
+                    logger.info("全てのプラットフォームの配信が記録済みです: ID=%s", post['id'])
+                else:
+                    logger.error("投稿先のプラットフォームが選択されていません: ID=%s", post['id'])
+                    final_status = 'failed'
+                if not self.db.update_post_status(post['id'], final_status, owner=self.owner):
+                    return None, {}
+                return final_status, {}
+
+            # 投稿モードの取得
+            post_mode = post.get('post_mode', 'unified')
+            post_logger.debug("投稿モード: %s", post_mode)
+
+            # メディアパスを取得
+            media_paths = json.loads(post['media_paths']) if post.get('media_paths') else None
+            if media_paths:
+                post_logger.debug("メディアファイル: %s", media_paths)
+
+            # プラットフォームごとの投稿内容を準備
+            targets = {}
+            results = {}
+            for platform, content_data in post_data.items():
+                # content_dataに'content'フィールドがあれば、それを先にチェック
+                if isinstance(content_data, dict) and content_data.get('content'):
+                    platform_content = content_data['content']
+                    post_logger.debug("プラットフォーム情報から直接コンテンツを取得: %s", platform)
+                else:
+                    # コンテンツ取得メソッドを使用
+                    platform_content = self._get_platform_content(content, platform, content_data, post_mode)
+                    post_logger.debug("取得したコンテンツ: %s: %s文字", platform, len(platform_content) if platform_content else 0)
+
+                if not platform_content:
+                    logger.error("プラットフォーム %s のコンテンツが空です", platform)
+                    results[platform] = {"success": False, "error": "投稿内容が空です", "retryable": False}
+                    continue
+
+                targets[platform] = platform_content
+
+            # SNSへの投稿を並列に実行
+            media_files = media_paths.get('files') if media_paths else None
+            results.update(sns_client.post_to_platforms(targets, media_files))
+
+            for platform, result in results.items():
+                if not result.get('success'):
+                    logger.error("プラットフォーム %s への投稿に失敗: %s", platform, result.get('error'))
+                else:
+                    post_logger.debug("プラットフォーム %s への投稿に成功", platform)
+
+            # プラットフォームごとの配信記録から投稿状態を決める
+            deliveries = self.db.record_deliveries(post['id'], results, self.max_attempts, owner=self.owner)
+            if deliveries is None:
+                return None, results
+            final_status, next_attempt_at = self._status_from_deliveries(deliveries, results)
+            if not self.db.update_post_status(post['id'], final_status, next_attempt_at=next_attempt_at, owner=self.owner):
+                return None, results
+            post_logger.info("投稿ID %s の状態を %s に更新しました", post['id'], final_status)
+            return final_status, results
+
+        except json.JSONDecodeError as e:
+            logger.error("JSONデコードエラー: %s", e)
+        except Exception as e:
+            logger.error("投稿処理中の予期せぬエラー: %s", e)
+        self.db.update_post_status(post['id'], 'failed', owner=self.owner)
+        return 'failed', {}
+
+    def _process_due_posts(self):
+        """予約時間を過ぎた投稿を確保して投稿し、確保した投稿数を返す"""
+        logger.debug("スケジューラーがチェックしています...")
+
+        # 現在時刻をUTCで取得
+        now = ensure_utc(datetime.datetime.now())
+        logger.debug("現在時刻(UTC): %s, 現在時刻(JST): %s", now.isoformat(), utc_to_jst(now).isoformat())
+
+        # 投稿予定時刻が現在時刻以前のpending状態の投稿を確保
+        pending_posts = self.db.claim_due_posts(
+            self.owner,
+            limit=self.batch_size,
+            lease_seconds=self.lease_seconds
+        )
+        if pending_posts:
+            logger.info("保留中の投稿数: %s", len(pending_posts))
+
+        for post in pending_posts:
+            try:
+                self.process_post(post)
+            except Exception as e:
+                logger.error("投稿処理中の重大なエラー: %s", e)
+                try:
+                    self.db.update_post_status(post['id'], 'failed', owner=self.owner)
+                except:
+                    pass
+
+        return len(pending_posts)
+
     def _scheduler_loop(self):
         while self.running:
             try:
-                logger.info("スケジューラーがチェックしています...")
-
-                # 現在時刻をUTCで取得
-                now = ensure_utc(datetime.datetime.now())
-                logger.info(f"現在時刻(UTC): {now.isoformat()}")
-                logger.info(f"現在時刻(JST): {utc_to_jst(now).isoformat()}")
-
-                # 投稿予定時刻が現在時刻以前のpending状態の投稿を取得
-                pending_posts = self.db.get_pending_posts()
-                logger.info(f"保留中の投稿数: {len(pending_posts)}")
-
-                for post in pending_posts:
-                    try:
-                        logger.info(f"スケジュールされた投稿を処理中: ID={post['id']}, 時刻={post['scheduled_time']}")
-
-                        # 投稿データの準備
-                        try:
-                            # JSONデータのデコード
-                            platforms = json.loads(post['platforms']) if isinstance(post['platforms'], str) else post['platforms']
-                            content = post['content']
-
-                            logger.info(f"投稿プラットフォーム: {list(platforms.keys())}")
-                            logger.info(f"投稿内容の長さ: {len(str(content))}")
-
-                            post_data = {}
-                            for platform, platform_content in platforms.items():
-                                if isinstance(platform_content, dict) and platform_content.get('selected'):
-                                    post_data[platform] = platform_content
-                                    logger.info(f"{platform}への投稿が選択されています")
-
-                            if not post_data:
-                                logger.error(f"投稿先のプラットフォームが選択されていません: ID={post['id']}")
-                                self.db.update_post_status(post['id'], 'failed')
-                                continue
-
-                            # 投稿モードの取得
-                            post_mode = post.get('post_mode', 'unified')
-                            logger.info(f"投稿モード: {post_mode}")
-
-                            # メディアパスを取得
-                            media_paths = json.loads(post['media_paths']) if post.get('media_paths') else None
-                            if media_paths:
-                                logger.info(f"メディアファイル: {media_paths}")
-
-                            # SNSへの投稿実行
-                            success = True
-                            for platform, content_data in post_data.items():
-                                try:
-                                    # プラットフォームのコンテンツを取得
-                                    # content_dataに'content'フィールドがあれば、それを先にチェック
-                                    if isinstance(content_data, dict) and 'content' in content_data:
-                                        platform_content = content_data['content']
-                                        logger.info(f"プラットフォーム情報から直接コンテンツを取得: {platform_content[:50] if platform_content else 'None'}")
-                                    else:
-                                        # コンテンツ取得メソッドを使用
-                                        platform_content = self._get_platform_content(content, platform, content_data, post_mode)
-                                        logger.info(f"取得したコンテンツ: {platform_content[:50] if platform_content else 'None'}")
-                                        if not platform_content:
-                                            logger.error(f"プラットフォーム {platform} のコンテンツが空です")
-                                            success = False
-                                            continue
-
-                                        if media_paths and media_paths.get('files'):
-                                            result = sns_client.post_with_media_to_platform(
-                                                platform,
-                                                platform_content,
-                                                media_paths['files']
-                                            )
-                                        else:
-                                            result = sns_client.post_to_platform(platform, platform_content)
-
-                                        if not result.get('success'):
-                                            logger.error(f"プラットフォーム {platform} への投稿に失敗: {result.get('error')}")
-                                            success = False
-                                        else:
-                                            logger.info(f"プラットフォーム {platform} への投稿に成功")
-
-                                except Exception as e:
-                                    logger.error(f"プラットフォーム {platform} への投稿でエラー発生: {e}")
-                                    success = False
-
-                            # 投稿状態の更新
-                            final_status = 'completed' if success else 'failed'
-                            self.db.update_post_status(post['id'], final_status)
-                            logger.info(f"投稿ID {post['id']} の状態を {final_status} に更新しました")
-
-                        except json.JSONDecodeError as e:
-                            logger.error(f"JSONデコードエラー: {e}")
-                            self.db.update_post_status(post['id'], 'failed')
-                        except Exception as e:
-                            logger.error(f"投稿処理中の予期せぬエラー: {e}")
-                            self.db.update_post_status(post['id'], 'failed')
-
-                    except Exception as e:
-                        logger.error(f"投稿処理中の重大なエラー: {e}")
-                        try:
-                            self.db.update_post_status(post['id'], 'failed')
-                        except:
-                            pass
+                # 要求されている場合はスケジューラーの1回の処理をcProfileで計測する
+                timer = start_timer()
+                with profiler.profile("scheduler", "tick"):
+                    processed = self._process_due_posts()
+                stop_timer()
+                if processed:
+                    logger.debug("%s件の投稿を処理しました: 全体 %.0fms, DB %.0fms, SNS %.0fms", processed,
+                                 timer.elapsed() * 1000, timer.durations["db"] * 1000, timer.durations["http"] * 1000)
 
-                time.sleep(self.check_interval)
+                # 上限まで取得できた場合は残りの投稿があるため待たずに次のバッチを処理する
+                if processed >= self.batch_size:
+                    continue
+
+                # 次の予約時間まで待機（待機中はコネクションを保持しない）
+                self._reload_due_times()
+                remove_session()
+                self._wait_for_next_due()
 
             except Exception as e:
-                logger.error(f"スケジューラーループでエラー発生: {e}")
+                logger.error("スケジューラーループでエラー発生: %s", e)
+                stop_timer()
+                remove_session()
                 time.sleep(self.check_interval)
@@ -1,17 +1,28 @@
 import os
+import re
 import json
+import time
+import hashlib
+import logging
+import threading
 import requests
-from atproto import Client as AtprotoClient, models
-import tweepy
-from mastodon import Mastodon
-import misskey
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 import mimetypes
-import cloudinary
-import cloudinary.uploader
-import ulid
 import sys
 from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from metrics import MEDIA_UPLOAD_LATENCY, RATE_LIMIT_HITS, record_post_result
+from ratelimit import RateLimiter, retry_after_seconds
+from validation import CHARACTER_LIMITS
+from profiling import profiler, timed
+
+logger = logging.getLogger("SnsClient")
+
+# 各SNSのSDK（atproto, tweepy, mastodon, misskey, cloudinary）はimportに時間がかかるため、
+# そのプラットフォームを初めて使う時点で関数内でimportする
 
 
 # .envファイルから環境変数を読み込む
@@ -22,8 +33,84 @@ CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
 
+# アップロード済みメディアの参照を再利用できる期間（秒）
+MEDIA_CACHE_TTLS = {
+    "x": 23 * 3600,                # media_idは24時間で失効する
+    "mastodon": 23 * 3600,         # 投稿に添付されるまでのメディアのみ再利用できる
+    "misskey": 30 * 24 * 3600,     # ドライブのファイルは削除されるまで再利用できる
+    "cloudinary": 30 * 24 * 3600,  # 公開URLは削除されるまで有効
+}
+MEDIA_CACHE_DEFAULT_TTL = 3600
+MEDIA_CACHE_MAX_ENTRIES = int(os.getenv("MEDIA_CACHE_MAX_ENTRIES", "1024"))
+
+
+def file_sha256(file_path):
+    """ファイルの内容のSHA-256ハッシュを返す"""
+    # /api/uploadで保存したファイルは内容のハッシュがファイル名になっている
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    if re.fullmatch(r'[0-9a-f]{64}', stem):
+        return stem
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaUploadCache:
+    """ファイルの内容のハッシュとプラットフォームをキーに、アップロード結果を保持するキャッシュ"""
+
+    def __init__(self, max_entries=MEDIA_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, platform, content_hash):
+        """有効期限内のアップロード結果を返す（なければNone）"""
+        key = (platform, content_hash)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, platform, content_hash, value):
+        """アップロード結果をプラットフォームごとの有効期限で保存する"""
+        ttl = MEDIA_CACHE_TTLS.get(platform, MEDIA_CACHE_DEFAULT_TTL)
+        key = (platform, content_hash)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, platform, content_hashes):
+        """プラットフォームが受け付けなくなった参照をキャッシュから削除する"""
+        with self.lock:
+            for content_hash in content_hashes:
+                self.entries.pop((platform, content_hash), None)
+
+
+# メディアアップロードキャッシュのインスタンス
+media_upload_cache = MediaUploadCache()
+
 # cloudinary upload
 def upload_media(image_path):
+    content_hash = file_sha256(image_path)
+    cached = media_upload_cache.get("cloudinary", content_hash)
+    if cached is not None:
+        return cached["url"]
+
+    import cloudinary
+    import cloudinary.uploader
+    import ulid
+
     cloudinary.config(
         cloud_name=CLOUDINARY_CLOUD_NAME,
         api_key=CLOUDINARY_API_KEY,
@@ -31,142 +118,394 @@ def upload_media(image_path):
         secure=True,
     )
 
+    started = time.perf_counter()
     upload_result = cloudinary.uploader.upload(
         image_path, public_id=f"threads/{ulid.new()}"
     )
+    MEDIA_UPLOAD_LATENCY.labels(platform="cloudinary").observe(time.perf_counter() - started)
+    media_upload_cache.set("cloudinary", content_hash, {"url": upload_result["secure_url"]})
     return upload_result["secure_url"]
 
-# 文字数制限の定義
-CHARACTER_LIMITS = {
-    "bluesky": 300,
-    "x": 280,
-    "threads": 500,
-    "misskey": 3000,
-    "mastodon": 500
-}
-
 def get_character_limits():
     """文字数制限を取得する関数"""
     return CHARACTER_LIMITS
 
+# 複数プラットフォームへ同時投稿する際のワーカー数の上限
+SNS_DISPATCH_MAX_WORKERS = int(os.getenv("SNS_DISPATCH_MAX_WORKERS", "5"))
+
+# 1つの投稿の添付ファイルをプラットフォームごとに並列アップロードする数の上限
+MEDIA_UPLOAD_CONCURRENCY = {
+    "x": 4,
+    "threads": 4,
+    "misskey": 4,
+    "mastodon": 2,
+}
+
+# レート制限（HTTP 429）を受けた投稿を再試行する回数と、1回あたりの待ち時間の上限（秒）
+# 待ち時間の合計は予約投稿のリース期間（600秒）より短くすること
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("SNS_RATE_LIMIT_MAX_RETRIES", "3"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("SNS_RATE_LIMIT_MAX_WAIT", "120"))
+# 画面からの即時投稿でレート制限のトークンを待つ時間の上限（秒）。超える場合は待たずに失敗を返す
+INTERACTIVE_RATE_LIMIT_MAX_WAIT = float(os.getenv("SNS_INTERACTIVE_RATE_LIMIT_MAX_WAIT", "5"))
+
+# ログインセッションを保存するディレクトリ（プロセス再起動後もセッションを再利用する）
+SNS_SESSION_DIR = os.getenv(
+    "SNS_SESSION_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions')
+)
+
+# APIの接続先（ベンチマーク用の偽サーバーなどに向ける場合に環境変数で上書きする）
+# Misskey・Mastodonは MISSKEY_INSTANCE_URL・MASTODON_INSTANCE_URL で指定する
+THREADS_API_BASE_URL = os.getenv("THREADS_API_BASE_URL", "https://graph.threads.net/v1.0")
+BLUESKY_BASE_URL = os.getenv("BLUESKY_BASE_URL")  # 例: http://localhost:8001/xrpc
+X_API_BASE_URL = os.getenv("X_API_BASE_URL")      # api.twitter.com・upload.twitter.com の代わりに使う
+
+
+def raise_for_threads_rate_limit(response):
+    """Threads APIのレート制限（HTTP 429）を例外にする（_error_resultで再試行までの秒数を取得するため）"""
+    if response.status_code == 429:
+        raise requests.HTTPError("Threads APIのレート制限に達しました", response=response)
+    return response
+
+# 再ログインが必要なBlueskyの認証エラー
+BLUESKY_AUTH_ERRORS = ('ExpiredToken', 'InvalidToken', 'AuthenticationRequired')
+
+
+# 各プラットフォームの設定に必要な環境変数
+PLATFORM_ENV_VARS = {
+    "bluesky": ("BLUESKY_USERNAME", "BLUESKY_PASSWORD"),
+    "x": ("X_API_KEY", "X_API_SECRET", "X_ACCESS_TOKEN", "X_ACCESS_TOKEN_SECRET"),
+    "threads": ("THREADS_ACCESS_TOKEN",),
+    "misskey": ("MISSKEY_API_TOKEN", "MISSKEY_INSTANCE_URL"),
+    "mastodon": ("MASTODON_ACCESS_TOKEN", "MASTODON_INSTANCE_URL"),
+}
+
+# クライアントの作成に失敗した後、再作成を試みるまでの間隔（秒）
+CLIENT_RETRY_SECONDS = 60
+
+
+class BaseUrlAdapter(HTTPAdapter):
+    """リクエストのスキームとホストをbase_urlに置き換えて送信するアダプター
+
+    接続先を変更できないSDK（tweepy）のセッションにマウントして使う。
+    """
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = self.base_url + request.url[len(f"{parts.scheme}://{parts.netloc}"):]
+        return super().send(request, **kwargs)
+
+
+class LazyPlatformClients:
+    """プラットフォームのクライアントを初回アクセス時に作成する辞書風のコンテナ
+
+    `platform in clients` や `clients[platform]` でアクセスした時点でクライアントを作成するため、
+    モジュールのimportやプロセスの起動時にはネットワーク通信が発生しない。
+    クライアントの状態は "unconfigured" / "configured" / "warming" / "ready" / "failed" のいずれか。
+    """
+
+    def __init__(self, factories):
+        self.factories = factories
+        self.clients = {}
+        self.states = {}
+        self.failed_at = {}
+        self.locks = {platform: threading.Lock() for platform in factories}
+
+    def is_configured(self, platform):
+        """プラットフォームの認証情報が環境変数に設定されているかを返す"""
+        return all(os.getenv(name) for name in PLATFORM_ENV_VARS.get(platform, ("",)))
+
+    def state(self, platform):
+        """クライアントを作成せずに現在の状態を返す"""
+        if platform in self.states:
+            return self.states[platform]
+        return "configured" if self.is_configured(platform) else "unconfigured"
+
+    def get(self, platform, default=None):
+        """クライアントを返す（未作成の場合はここで作成する）"""
+        if platform in self.clients:
+            return self.clients[platform]
+        if platform not in self.factories or not self.is_configured(platform):
+            return default
+
+        with self.locks[platform]:
+            if platform in self.clients:
+                return self.clients[platform]
+
+            failed_at = self.failed_at.get(platform)
+            if failed_at is not None and time.monotonic() - failed_at < CLIENT_RETRY_SECONDS:
+                return default
+
+            self.states[platform] = "warming"
+            try:
+                client = self.factories[platform]()
+            except Exception as e:
+                logger.error("%s setup error: %s", platform, e)
+                self.states[platform] = "failed"
+                self.failed_at[platform] = time.monotonic()
+                return default
+
+            self.clients[platform] = client
+            self.states[platform] = "ready"
+            return client
+
+    def warm_up(self):
+        """設定済みの全てのクライアントを作成する"""
+        for platform in self.factories:
+            self.get(platform)
+
+    def __contains__(self, platform):
+        return self.get(platform) is not None
+
+    def __getitem__(self, platform):
+        client = self.get(platform)
+        if client is None:
+            raise KeyError(platform)
+        return client
+
+    def __setitem__(self, platform, client):
+        self.clients[platform] = client
+        self.states[platform] = "ready"
+
 
 class SnsClient:
     def __init__(self):
         """SNSクライアントの初期化"""
-        self.clients = {}
+        # Blueskyの再ログインを1スレッドに限定するためのロック
+        self.bluesky_lock = threading.Lock()
+        # プラットフォーム同時投稿用のワーカープール（全リクエストで共有して並列数を制限する）
+        self.executor = ThreadPoolExecutor(
+            max_workers=SNS_DISPATCH_MAX_WORKERS,
+            thread_name_prefix="sns-dispatch"
+        )
+        # 画面からの即時投稿用のワーカープール（予約投稿のレート制限の待ちに巻き込まれないよう分ける）
+        self.interactive_executor = ThreadPoolExecutor(
+            max_workers=SNS_DISPATCH_MAX_WORKERS,
+            thread_name_prefix="sns-interactive"
+        )
+        # プラットフォーム・アカウントごとのレート制限
+        self.rate_limiter = RateLimiter()
+        # 添付ファイルのアップロード用のワーカープール（プラットフォームごとに並列数を制限する）
+        self.media_executors = {
+            platform: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{platform}-upload")
+            for platform, max_workers in MEDIA_UPLOAD_CONCURRENCY.items()
+        }
         self.setup_clients()
 
     def setup_clients(self):
-        """各SNSクライアントのセットアップ"""
-        # Blueskyのセットアップ
+        """各SNSクライアントを初回使用時に作成するように設定する"""
+        self.clients = LazyPlatformClients({
+            "bluesky": self._create_bluesky_client,
+            "x": self._create_x_client,
+            "threads": self._create_threads_client,
+            "misskey": self._create_misskey_client,
+            "mastodon": self._create_mastodon_client,
+        })
+
+    def start_warm_up(self):
+        """設定済みのクライアントをバックグラウンドで作成しておく"""
+        thread = threading.Thread(target=self.clients.warm_up, name="sns-warm-up")
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _create_bluesky_client(self):
+        """Blueskyのセットアップ"""
+        return self._login_bluesky(os.getenv("BLUESKY_USERNAME"), os.getenv("BLUESKY_PASSWORD"))
+
+    def _create_x_client(self):
+        """X/Twitterのセットアップ"""
+        import tweepy
+
+        x_api_key = os.getenv("X_API_KEY")
+        x_api_secret = os.getenv("X_API_SECRET")
+        x_access_token = os.getenv("X_ACCESS_TOKEN")
+        x_access_token_secret = os.getenv("X_ACCESS_TOKEN_SECRET")
+
+        # APIクライアント（V2）
+        client = tweepy.Client(
+            consumer_key=x_api_key,
+            consumer_secret=x_api_secret,
+            access_token=x_access_token,
+            access_token_secret=x_access_token_secret
+        )
+
+        # メディアアップロード用のv1.1 APIも設定
+        auth = tweepy.OAuth1UserHandler(
+            x_api_key, x_api_secret, x_access_token, x_access_token_secret
+        )
+        api_v1 = tweepy.API(auth)
+
+        if X_API_BASE_URL:
+            adapter = BaseUrlAdapter(X_API_BASE_URL)
+            for session in (client.session, api_v1.session):
+                session.mount("https://api.twitter.com", adapter)
+                session.mount("https://upload.twitter.com", adapter)
+
+        return {
+            "client": client,
+            "api_v1": api_v1
+        }
+
+    def _create_threads_client(self):
+        """Threadsのセットアップ"""
+        return os.getenv("THREADS_ACCESS_TOKEN")
+
+    def _create_misskey_client(self):
+        """Misskeyのセットアップ"""
+        import misskey
+
+        return misskey.Misskey(os.getenv("MISSKEY_INSTANCE_URL"), i=os.getenv("MISSKEY_API_TOKEN"))
+
+    def _create_mastodon_client(self):
+        """Mastodonのセットアップ"""
+        from mastodon import Mastodon
+
+        # レート制限はライブラリ内で待たずに例外にする（トークンバケットと再試行の上限で制御するため）
+        return Mastodon(
+            access_token=os.getenv("MASTODON_ACCESS_TOKEN"),
+            api_base_url=os.getenv("MASTODON_INSTANCE_URL"),
+            ratelimit_method="throw"
+        )
+
+    def _error_result(self, error):
+        """例外から失敗時の結果を作成する（レート制限の場合は再試行までの秒数を含める）"""
+        retry_after = retry_after_seconds(error)
+        if retry_after is None and type(error).__name__ == "MastodonRatelimitError":
+            retry_after = self._mastodon_retry_after()
+        return {
+            "success": False,
+            "error": str(error),
+            "error_class": type(error).__name__,
+            "retry_after": retry_after
+        }
+
+    def _mastodon_retry_after(self):
+        """Mastodonのレート制限が解除されるまでの秒数を返す
+
+        MastodonRatelimitErrorはレスポンスを持たないため、クライアントが記録している
+        ratelimit_reset（レスポンスヘッダーから取得した解除時刻のUNIX時間）から求める。
+        """
+        reset = getattr(self.clients.get("mastodon"), "ratelimit_reset", None)
+        if reset is None:
+            return 60.0
+        return max(float(reset) - time.time(), 0.0)
+
+    def _media_upload_failure(self, results):
+        """メディアのアップロードが全て失敗した場合の結果を返す（レート制限の場合はその結果を返す）"""
+        for result in results:
+            if result.get("retry_after") is not None:
+                return result
+        return {"success": False, "error": "メディアのアップロードに失敗しました"}
+
+    def _account_key(self, platform):
+        """レート制限を共有するアカウントの識別子を返す"""
+        env_names = PLATFORM_ENV_VARS.get(platform)
+        if not env_names or not os.getenv(env_names[0]):
+            return None
+        return hashlib.sha256(os.getenv(env_names[0]).encode()).hexdigest()[:12]
+
+    def _bluesky_session_path(self, username):
+        """Blueskyのセッションを保存するファイルのパスを返す"""
+        safe_username = re.sub(r'[^A-Za-z0-9_.-]', '_', username)
+        return os.path.join(SNS_SESSION_DIR, f"bluesky_{safe_username}.session")
+
+    def _save_bluesky_session(self, username, session_string):
+        """Blueskyのセッション文字列をファイルに保存する"""
         try:
-            bluesky_username = os.getenv("BLUESKY_USERNAME")
-            bluesky_password = os.getenv("BLUESKY_PASSWORD")
-            if bluesky_username and bluesky_password:
-                bluesky_client = AtprotoClient()
-                bluesky_client.login(bluesky_username, bluesky_password)
-                self.clients["bluesky"] = bluesky_client
+            os.makedirs(SNS_SESSION_DIR, exist_ok=True)
+            session_path = self._bluesky_session_path(username)
+            tmp_path = f"{session_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(session_string)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, session_path)
         except Exception as e:
-            print(f"Bluesky setup error: {e}")
+            logger.error("Bluesky session save error: %s", e)
 
-        # X/Twitterのセットアップ
-        try:
-            x_api_key = os.getenv("X_API_KEY")
-            x_api_secret = os.getenv("X_API_SECRET")
-            x_access_token = os.getenv("X_ACCESS_TOKEN")
-            x_access_token_secret = os.getenv("X_ACCESS_TOKEN_SECRET")
-
-            if all([x_api_key, x_api_secret, x_access_token, x_access_token_secret]):
-                # APIクライアント（V2）
-                client = tweepy.Client(
-                    consumer_key=x_api_key,
-                    consumer_secret=x_api_secret,
-                    access_token=x_access_token,
-                    access_token_secret=x_access_token_secret
-                )
+    def _login_bluesky(self, username, password, use_saved_session=True):
+        """Blueskyにログインしたクライアントを返す
 
-                # メディアアップロード用のv1.1 APIも設定
-                auth = tweepy.OAuth1UserHandler(
-                    x_api_key, x_api_secret, x_access_token, x_access_token_secret
-                )
-                api_v1 = tweepy.API(auth)
+        保存済みのセッションがあれば再利用し、createSessionの呼び出しを避ける。
+        アクセストークンの期限が近づくとクライアントがリフレッシュトークンで更新し、
+        更新後のセッションはon_session_changeでファイルに保存される。
+        """
+        from atproto import Client as AtprotoClient
 
-                self.clients["x"] = {
-                    "client": client,
-                    "api_v1": api_v1
-                }
-        except Exception as e:
-            print(f"X/Twitter setup error: {e}")
+        client = AtprotoClient(base_url=BLUESKY_BASE_URL)
+        client.on_session_change(
+            lambda event, session: self._save_bluesky_session(username, client.export_session_string())
+        )
 
-        # Threadsのセットアップ
-        try:
-            threads_access_token = os.getenv("THREADS_ACCESS_TOKEN")
-            if threads_access_token:
-                self.clients["threads"] = threads_access_token
-        except Exception as e:
-            print(f"Threads setup error: {e}")
+        session_path = self._bluesky_session_path(username)
+        if use_saved_session and os.path.exists(session_path):
+            try:
+                with open(session_path) as f:
+                    client.login(session_string=f.read().strip())
+                return client
+            except Exception as e:
+                logger.warning("Bluesky session restore error: %s", e)
 
-        # Misskeyのセットアップ
-        try:
-            misskey_token = os.getenv("MISSKEY_API_TOKEN")
-            misskey_instance = os.getenv("MISSKEY_INSTANCE_URL")
-            if misskey_token and misskey_instance:
-                misskey_client = misskey.Misskey(misskey_instance, i=misskey_token)
-                self.clients["misskey"] = misskey_client
-        except Exception as e:
-            print(f"Misskey setup error: {e}")
+        client.login(username, password)
+        return client
+
+    def _run_with_bluesky(self, action):
+        """キャッシュしたBlueskyクライアントで処理を実行する
 
-        # Mastodonのセットアップ
+        セッションが無効になっていた場合はパスワードで再ログインして1回だけ再試行する。
+        """
+        client = self.clients["bluesky"]
         try:
-            mastodon_token = os.getenv("MASTODON_ACCESS_TOKEN")
-            mastodon_instance = os.getenv("MASTODON_INSTANCE_URL")
-            if mastodon_token and mastodon_instance:
-                mastodon_client = Mastodon(
-                    access_token=mastodon_token,
-                    api_base_url=mastodon_instance
-                )
-                self.clients["mastodon"] = mastodon_client
+            return action(client)
         except Exception as e:
-            print(f"Mastodon setup error: {e}")
+            if not any(error in str(e) for error in BLUESKY_AUTH_ERRORS):
+                raise
+
+        with self.bluesky_lock:
+            # 他のスレッドが既に再ログインしている場合はそのクライアントを使う
+            if self.clients["bluesky"] is client:
+                self.clients["bluesky"] = self._login_bluesky(
+                    os.getenv("BLUESKY_USERNAME"),
+                    os.getenv("BLUESKY_PASSWORD"),
+                    use_saved_session=False
+                )
+        return action(self.clients["bluesky"])
 
     def post_to_bluesky(self, content):
         """Blueskyに投稿する関数"""
         try:
             if "bluesky" in self.clients:
-                bluesky_username = os.getenv("BLUESKY_USERNAME")
-                bluesky_password = os.getenv("BLUESKY_PASSWORD")
-                if bluesky_username and bluesky_password:
-                    bluesky_client = AtprotoClient()
-                    bluesky_client.login(bluesky_username, bluesky_password)
-                    response = bluesky_client.send_post(content)
-                    return {"success": True, "response": "投稿成功"}
-                else:
-                    return {"success": False, "error": "Blueskyのユーザー名とパスワードが設定されていません"}
+                response = self._run_with_bluesky(lambda client: client.send_post(content))
+                return {"success": True, "response": "投稿成功", "remote_id": response.uri}
             return {"success": False, "error": "Blueskyクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_to_x(self, content):
         """X/Twitterに投稿する関数"""
         try:
             if "x" in self.clients:
                 response = self.clients["x"]["client"].create_tweet(text=content)
-                return {"success": True, "response": "投稿成功"}
+                return {"success": True, "response": "投稿成功", "remote_id": response.data["id"]}
             return {"success": False, "error": "Xクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_to_threads(self, content):
         """Threadsに投稿する関数"""
         try:
             if "threads" in self.clients:
                 access_token = self.clients["threads"]
-                api_base_url = "https://graph.threads.net/v1.0"
+                api_base_url = THREADS_API_BASE_URL
 
                 # ユーザーIDを取得
                 user_url = f"{api_base_url}/me"
                 user_headers = {"Authorization": f"Bearer {access_token}"}
-                user_response = requests.get(user_url, headers=user_headers)
+                user_response = raise_for_threads_rate_limit(requests.get(user_url, headers=user_headers))
 
                 if user_response.ok:
                     user_id = user_response.json().get("id")
@@ -178,7 +517,9 @@ class SnsClient:
                         "Authorization": f"Bearer {access_token}",
                         "Content-Type": "application/json"
                     }
-                    response = requests.post(create_url, json=create_data, headers=create_headers)
+                    response = raise_for_threads_rate_limit(
+                        requests.post(create_url, json=create_data, headers=create_headers)
+                    )
 
                     if response.ok:
                         creation_id = response.json().get("id")
@@ -190,35 +531,37 @@ class SnsClient:
                             "Authorization": f"Bearer {access_token}",
                             "Content-Type": "application/json"
                         }
-                        publish_response = requests.post(publish_url, json=publish_data, headers=publish_headers)
+                        publish_response = raise_for_threads_rate_limit(
+                            requests.post(publish_url, json=publish_data, headers=publish_headers)
+                        )
 
                         if publish_response.ok:
-                            return {"success": True, "response": "投稿成功"}
+                            return {"success": True, "response": "投稿成功", "remote_id": publish_response.json().get("id")}
 
                 return {"success": False, "error": "Threads APIの呼び出しに失敗しました"}
             return {"success": False, "error": "Threadsクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_to_misskey(self, content):
         """Misskeyに投稿する関数"""
         try:
             if "misskey" in self.clients:
                 note = self.clients["misskey"].notes_create(text=content)
-                return {"success": True, "response": "投稿成功"}
+                return {"success": True, "response": "投稿成功", "remote_id": note["createdNote"]["id"]}
             return {"success": False, "error": "Misskeyクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_to_mastodon(self, content):
         """Mastodonに投稿する関数"""
         try:
             if "mastodon" in self.clients:
                 status = self.clients["mastodon"].status_post(content)
-                return {"success": True, "response": "投稿成功"}
+                return {"success": True, "response": "投稿成功", "remote_id": status["id"]}
             return {"success": False, "error": "Mastodonクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_to_platform(self, platform, content):
         """指定のプラットフォームに投稿する"""
@@ -235,32 +578,74 @@ class SnsClient:
         else:
             return {"success": False, "error": f"未対応のプラットフォーム: {platform}"}
 
+    def _upload_with_cache(self, platform, file_path, upload):
+        """同じ内容のファイルがアップロード済みであれば、その参照を再利用する
+
+        結果にはファイルのハッシュ（content_hash）と、キャッシュを使用したか（cached）を含める。
+        """
+        content_hash = file_sha256(file_path)
+        cached = media_upload_cache.get(platform, content_hash)
+        if cached is not None:
+            return {"success": True, **cached, "content_hash": content_hash, "cached": True}
+
+        started = time.perf_counter()
+        result = upload()
+        MEDIA_UPLOAD_LATENCY.labels(platform=platform).observe(time.perf_counter() - started)
+        if result["success"]:
+            media_upload_cache.set(platform, content_hash, {k: v for k, v in result.items() if k != "success"})
+            result = {**result, "content_hash": content_hash, "cached": False}
+        return result
+
+    def _upload_media_files(self, platform, file_paths, upload):
+        """添付ファイルを並列にアップロードし、元の順序で結果を返す"""
+        if len(file_paths) <= 1:
+            return [upload(file_path) for file_path in file_paths]
+        return list(self.media_executors[platform].map(profiler.wrap(upload), file_paths))
+
     def upload_media_to_x(self, file_path):
         """X/Twitterにメディアをアップロードする関数"""
         try:
             if "x" in self.clients:
-                # V1.1 APIを使用してメディアをアップロード
-                media = self.clients["x"]["api_v1"].media_upload(file_path)
-                return {
-                    "success": True,
-                    "media_id": media.media_id
-                }
+                def upload():
+                    # V1.1 APIを使用してメディアをアップロード（動画はチャンク分割でアップロードする）
+                    is_video = file_path.lower().endswith(('.mp4', '.mov'))
+                    with open(file_path, 'rb') as f:
+                        media = self.clients["x"]["api_v1"].media_upload(
+                            file_path,
+                            file=f,
+                            chunked=is_video,
+                            media_category="tweet_video" if is_video else None
+                        )
+                    return {
+                        "success": True,
+                        "media_id": media.media_id
+                    }
+
+                return self._upload_with_cache("x", file_path, upload)
 
             return {"success": False, "error": "Xクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
+
+    def _prefetch_cloudinary_url(self, file_path):
+        """Cloudinaryに画像をアップロードしてURLをキャッシュする（失敗した場合はNone）"""
+        try:
+            return upload_media(file_path)
+        except Exception as e:
+            logger.error("Cloudinary upload error: %s", e)
+            return None
 
     def upload_media_to_threads(self,content, file_path):
         """Threadsにメディアをアップロードする関数 (cloudinaryを使用)"""
         try:
             if "threads" in self.clients:
                 access_token = self.clients["threads"]
-                api_base_url = "https://graph.threads.net/v1.0"
+                api_base_url = THREADS_API_BASE_URL
 
                 # ユーザーIDを取得
                 user_url = f"{api_base_url}/me"
                 user_headers = {"Authorization": f"Bearer {access_token}"}
-                user_response = requests.get(user_url, headers=user_headers)
+                user_response = raise_for_threads_rate_limit(requests.get(user_url, headers=user_headers))
 
                 if user_response.ok:
                     user_id = user_response.json().get("id")
@@ -272,7 +657,9 @@ class SnsClient:
                         "Authorization": f"Bearer {access_token}",
                         "Content-Type": "application/json"
                     }
-                    response = requests.post(create_url, json=create_data, headers=create_headers)
+                    response = raise_for_threads_rate_limit(
+                        requests.post(create_url, json=create_data, headers=create_headers)
+                    )
 
                     if response.ok:
                         creation_id = response.json().get("id")
@@ -284,7 +671,9 @@ class SnsClient:
                             "Authorization": f"Bearer {access_token}",
                             "Content-Type": "application/json"
                         }
-                        publish_response = requests.post(publish_url, json=publish_data, headers=publish_headers)
+                        publish_response = raise_for_threads_rate_limit(
+                            requests.post(publish_url, json=publish_data, headers=publish_headers)
+                        )
 
                         if publish_response.ok:
                             return {
@@ -295,68 +684,72 @@ class SnsClient:
                 return {"success": False, "error": "Threads APIの呼び出しに失敗しました"}
             return {"success": False, "error": "Threadsクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
 
     def upload_media_to_misskey(self, file_path):
         """Misskeyにメディアをアップロードする関数"""
         try:
             if "misskey" in self.clients:
-                with open(file_path, 'rb') as f:
-                    file_data = f.read()
-
-                # MIMEタイプを取得
-                mime_type, _ = mimetypes.guess_type(file_path)
-                if not mime_type:
-                    # デフォルトのMIMEタイプを設定
-                    if file_path.lower().endswith(('.jpg', '.jpeg')):
-                        mime_type = 'image/jpeg'
-                    elif file_path.lower().endswith('.png'):
-                        mime_type = 'image/png'
-                    elif file_path.lower().endswith('.gif'):
-                        mime_type = 'image/gif'
-                    elif file_path.lower().endswith(('.mp4', '.mov')):
-                        mime_type = 'video/mp4'
-                    else:
-                        mime_type = 'application/octet-stream'
-
-                # ファイル名の取得
-                file_name = os.path.basename(file_path)
-
-                # Misskeyにドライブファイルとしてアップロード
-                drive_file = self.clients["misskey"].drive_files_create(
-                    file=file_data,
-                    name=file_name,
-                    force=False
-                )
+                def upload():
+                    # MIMEタイプを取得
+                    mime_type, _ = mimetypes.guess_type(file_path)
+                    if not mime_type:
+                        # デフォルトのMIMEタイプを設定
+                        if file_path.lower().endswith(('.jpg', '.jpeg')):
+                            mime_type = 'image/jpeg'
+                        elif file_path.lower().endswith('.png'):
+                            mime_type = 'image/png'
+                        elif file_path.lower().endswith('.gif'):
+                            mime_type = 'image/gif'
+                        elif file_path.lower().endswith(('.mp4', '.mov')):
+                            mime_type = 'video/mp4'
+                        else:
+                            mime_type = 'application/octet-stream'
+
+                    # ファイル名の取得
+                    file_name = os.path.basename(file_path)
+
+                    # Misskeyにドライブファイルとしてアップロード（ファイルハンドルから読み込む）
+                    with open(file_path, 'rb') as f:
+                        drive_file = self.clients["misskey"].drive_files_create(
+                            file=f,
+                            name=file_name,
+                            force=False
+                        )
 
-                return {
-                    "success": True,
-                    "file_id": drive_file["id"]
-                }
+                    return {
+                        "success": True,
+                        "file_id": drive_file["id"]
+                    }
+
+                return self._upload_with_cache("misskey", file_path, upload)
 
             return {"success": False, "error": "Misskeyクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def upload_media_to_mastodon(self, file_path):
         """Mastodonにメディアをアップロードする関数"""
         try:
             if "mastodon" in self.clients:
-                # Mastodonにメディアをアップロード
-                media = self.clients["mastodon"].media_post(
-                    media_file=file_path,
-                    description="Uploaded from SNS Poster App"
-                )
+                def upload():
+                    # Mastodonにメディアをアップロード
+                    media = self.clients["mastodon"].media_post(
+                        media_file=file_path,
+                        description="Uploaded from SNS Poster App"
+                    )
 
-                return {
-                    "success": True,
-                    "media_id": media["id"]
-                }
+                    return {
+                        "success": True,
+                        "media_id": media["id"]
+                    }
+
+                return self._upload_with_cache("mastodon", file_path, upload)
 
             return {"success": False, "error": "Mastodonクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_with_media_to_bluesky(self, content, media_files):
         """Blueskyにメディア付きで投稿する関数"""
@@ -365,15 +758,6 @@ class SnsClient:
                 if not media_files or len(media_files) == 0:
                     return self.post_to_bluesky(content)
 
-                bluesky_client = AtprotoClient()
-                bluesky_username = os.getenv("BLUESKY_USERNAME")
-                bluesky_password = os.getenv("BLUESKY_PASSWORD")
-                bluesky_client.login(bluesky_username, bluesky_password)
-
-                if not bluesky_client.me.did:
-                    return {"success": False, "error": "Blueskyの認証情報が設定されていません"}
-
-
                 # メディアファイルのディレクトリパスを取得
                 # media_filesは配列で渡されるため、最初のファイルのディレクトリを取得
                 first_file_path = media_files[0]
@@ -388,15 +772,22 @@ class SnsClient:
                 if not image_files:
                     return {"success": False, "error": "有効な画像ファイルが見つかりません"}
 
-                # メディアをアップロード
                 with open(image_files[0], 'rb') as f:
                     img_data = f.read()
+                    img_name = f.name
 
+                from atproto import models
+
+                def send_post(bluesky_client):
+                    if not bluesky_client.me.did:
+                        raise ValueError("Blueskyの認証情報が設定されていません")
+
+                    # メディアをアップロード
                     upload = bluesky_client.upload_blob(img_data)
-                    images = [models.AppBskyEmbedImages.Image(alt=f.name, image=upload.blob)]
+                    images = [models.AppBskyEmbedImages.Image(alt=img_name, image=upload.blob)]
                     embed = models.AppBskyEmbedImages.Main(images=images)
 
-                    bluesky_client.com.atproto.repo.create_record(
+                    return bluesky_client.com.atproto.repo.create_record(
                         models.ComAtprotoRepoCreateRecord.Data(
                             repo=bluesky_client.me.did,
                             collection=models.ids.AppBskyFeedPost,
@@ -406,11 +797,12 @@ class SnsClient:
                         )
                     )
 
-                    return {"success": True, "response": "メディア付き投稿成功"}
+                response = self._run_with_bluesky(send_post)
+                return {"success": True, "response": "メディア付き投稿成功", "remote_id": response.uri}
 
             return {"success": False, "error": "Blueskyクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_with_media_to_x(self, content, media_files):
         """X/Twitterにメディア付きで投稿する関数"""
@@ -421,25 +813,34 @@ class SnsClient:
 
                 # 最大4つのメディアをアップロード
                 media_ids = []
-                for file_path in media_files[:4]:  # X/Twitterは最大4つのメディアをサポート
-                    media_result = self.upload_media_to_x(file_path)
+                cached_hashes = []
+                # X/Twitterは最大4つのメディアをサポート
+                media_results = self._upload_media_files("x", media_files[:4], self.upload_media_to_x)
+                for media_result in media_results:
                     if media_result["success"]:
                         media_ids.append(media_result["media_id"])
+                        if media_result["cached"]:
+                            cached_hashes.append(media_result["content_hash"])
 
                 if not media_ids:
-                    return {"success": False, "error": "メディアのアップロードに失敗しました"}
+                    return self._media_upload_failure(media_results)
 
                 # メディア付き投稿
-                response = self.clients["x"]["client"].create_tweet(
-                    text=content,
-                    media_ids=media_ids
-                )
+                try:
+                    response = self.clients["x"]["client"].create_tweet(
+                        text=content,
+                        media_ids=media_ids
+                    )
+                except Exception:
+                    # 失効したmedia_idの可能性があるため、次回は再アップロードする
+                    media_upload_cache.discard("x", cached_hashes)
+                    raise
 
-                return {"success": True, "response": "メディア付き投稿成功"}
+                return {"success": True, "response": "メディア付き投稿成功", "remote_id": response.data["id"]}
 
             return {"success": False, "error": "Xクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_with_media_to_threads(self, content, media_files):
         """Threadsにメディア付きで投稿する関数"""
@@ -448,20 +849,26 @@ class SnsClient:
                 if not media_files or len(media_files) == 0:
                     return self.post_to_threads(content)
 
+                # 画像をCloudinaryへ並列にアップロードしておく（投稿時はキャッシュしたURLを使う）
+                self._upload_media_files("threads", media_files, self._prefetch_cloudinary_url)
+
                 # メディアをアップロード
                 file_ids = []
+                media_results = []
                 for file_path in media_files:
                     media_result = self.upload_media_to_threads(content,file_path)
+                    media_results.append(media_result)
                     if media_result["success"]:
                         file_ids.append(media_result["file_id"])
 
                 if not file_ids:
-                    return {"success": False, "error": "メディアのアップロードに失敗しました"}
+                    return self._media_upload_failure(media_results)
 
-                return {"success": True, "response": "メディア付き投稿成功"}
+                return {"success": True, "response": "メディア付き投稿成功", "remote_id": file_ids[0]}
 
+            return {"success": False, "error": "Threadsクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_with_media_to_misskey(self, content, media_files):
         """Misskeyにメディア付きで投稿する関数"""
@@ -472,25 +879,33 @@ class SnsClient:
 
                 # メディアをアップロード
                 file_ids = []
-                for file_path in media_files:
-                    media_result = self.upload_media_to_misskey(file_path)
+                cached_hashes = []
+                media_results = self._upload_media_files("misskey", media_files, self.upload_media_to_misskey)
+                for media_result in media_results:
                     if media_result["success"]:
                         file_ids.append(media_result["file_id"])
+                        if media_result["cached"]:
+                            cached_hashes.append(media_result["content_hash"])
 
                 if not file_ids:
-                    return {"success": False, "error": "メディアのアップロードに失敗しました"}
+                    return self._media_upload_failure(media_results)
 
                 # メディア付き投稿
-                note = self.clients["misskey"].notes_create(
-                    text=content,
-                    file_ids=file_ids
-                )
+                try:
+                    note = self.clients["misskey"].notes_create(
+                        text=content,
+                        file_ids=file_ids
+                    )
+                except Exception:
+                    # ドライブから削除されたファイルの可能性があるため、次回は再アップロードする
+                    media_upload_cache.discard("misskey", cached_hashes)
+                    raise
 
-                return {"success": True, "response": "メディア付き投稿成功"}
+                return {"success": True, "response": "メディア付き投稿成功", "remote_id": note["createdNote"]["id"]}
 
             return {"success": False, "error": "Misskeyクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_with_media_to_mastodon(self, content, media_files):
         """Mastodonにメディア付きで投稿する関数"""
@@ -501,25 +916,39 @@ class SnsClient:
 
                 # メディアをアップロード（最大4つ）
                 media_ids = []
-                for file_path in media_files[:4]:  # Mastodonは通常4つまでのメディアをサポート
-                    media_result = self.upload_media_to_mastodon(file_path)
+                content_hashes = []
+                cached_hashes = []
+                # Mastodonは通常4つまでのメディアをサポート
+                media_results = self._upload_media_files("mastodon", media_files[:4], self.upload_media_to_mastodon)
+                for media_result in media_results:
                     if media_result["success"]:
                         media_ids.append(media_result["media_id"])
+                        content_hashes.append(media_result["content_hash"])
+                        if media_result["cached"]:
+                            cached_hashes.append(media_result["content_hash"])
 
                 if not media_ids:
-                    return {"success": False, "error": "メディアのアップロードに失敗しました"}
+                    return self._media_upload_failure(media_results)
 
                 # メディア付き投稿
-                status = self.clients["mastodon"].status_post(
-                    content,
-                    media_ids=media_ids
-                )
+                try:
+                    status = self.clients["mastodon"].status_post(
+                        content,
+                        media_ids=media_ids
+                    )
+                except Exception:
+                    # 失効したメディアの可能性があるため、次回は再アップロードする
+                    media_upload_cache.discard("mastodon", cached_hashes)
+                    raise
+
+                # 投稿に添付したメディアは別の投稿に再利用できないため破棄する
+                media_upload_cache.discard("mastodon", content_hashes)
 
-                return {"success": True, "response": "メディア付き投稿成功"}
+                return {"success": True, "response": "メディア付き投稿成功", "remote_id": status["id"]}
 
             return {"success": False, "error": "Mastodonクライアントが設定されていません"}
         except Exception as e:
-            return {"success": False, "error": str(e)}
+            return self._error_result(e)
 
     def post_with_media_to_platform(self, platform, content, media_files):
         """指定プラットフォームにメディア付きで投稿する関数"""
@@ -536,24 +965,88 @@ class SnsClient:
         else:
             return {"success": False, "error": f"未対応のプラットフォーム: {platform}"}
 
-    def post_to_platforms(self, posts):
-        """複数のプラットフォームに投稿する関数
+    def _dispatch_to_platform(self, platform, content, media_files=None, interactive=False):
+        """1つのプラットフォームへ投稿する（ワーカースレッドから呼ばれる）
+
+        interactiveの場合（画面からの即時投稿）はレート制限で長く待たず、レート制限を受けても
+        再試行せずに失敗を返す（予約投稿はスケジューラーが再試行する）。
+        """
+        account = self._account_key(platform)
+        max_retries = 0 if interactive else RATE_LIMIT_MAX_RETRIES
+        for attempt in range(max_retries + 1):
+            # レート制限の範囲内になるまで待機してから投稿する
+            # （サーバーから通知された長いレート制限中は待たずに失敗を返し、予約投稿はスケジューラーが後で再試行する）
+            max_wait = INTERACTIVE_RATE_LIMIT_MAX_WAIT if interactive else RATE_LIMIT_MAX_WAIT
+            if self.rate_limiter.acquire(platform, account, max_wait=max_wait) is None:
+                wait = self.rate_limiter.wait_time(platform, account)
+                return {
+                    "success": False,
+                    "error": f"レート制限のため投稿できません（約{wait:.0f}秒後に再試行してください）",
+                    "error_class": "RateLimited",
+                    "retry_after": wait
+                }
+
+            started = time.perf_counter()
+            try:
+                if media_files:
+                    result = self.post_with_media_to_platform(platform, content, media_files)
+                else:
+                    result = self.post_to_platform(platform, content)
+            except Exception as e:
+                result = self._error_result(e)
+                result["error"] = f"投稿処理中にエラーが発生しました: {str(e)}"
+            elapsed = time.perf_counter() - started
+            record_post_result(platform, result, elapsed, media=bool(media_files))
+            result["latency_ms"] = int(elapsed * 1000)
+            # 認証情報が設定されていないプラットフォームは再試行しても成功しない
+            if not result.get("success") and not self.clients.is_configured(platform):
+                result["retryable"] = False
+
+            # レート制限を受けた場合は、指定された時間だけ待ってから再試行する
+            retry_after = result.get("retry_after")
+            if result.get("success") or retry_after is None:
+                return result
+            RATE_LIMIT_HITS.labels(platform=platform).inc()
+            # 再試行しない場合も、レート制限が解除されるまで以降の投稿をプラットフォームに送らない
+            self.rate_limiter.block_for(platform, retry_after, account)
+            if attempt == max_retries or retry_after > RATE_LIMIT_MAX_WAIT:
+                return result
+            logger.warning("%s rate limited, retrying in %.0fs", platform, retry_after)
+
+        return result
+
+    def post_to_platforms(self, posts, media_files=None, interactive=False):
+        """複数のプラットフォームに同時に投稿する関数
+
+        各プラットフォームへの投稿はワーカープールで並列に実行されるため、
+        全体の所要時間は最も遅いプラットフォームの応答時間とほぼ等しくなる。
 
         Args:
             posts: プラットフォーム名をキー、プラットフォーム情報を値とする辞書
+            media_files: 添付するメディアファイルのパスのリスト（省略時はテキストのみ）
+            interactive: 画面からの即時投稿の場合はTrue（レート制限で待たずに失敗を返す）
 
         Returns:
             各プラットフォームの投稿結果を含む辞書
         """
-        results = {}
-
+        targets = {}
         for platform, content_data in posts.items():
             if isinstance(content_data, dict) and content_data.get("content"):
-                results[platform] = self.post_to_platform(platform, content_data["content"])
+                targets[platform] = content_data["content"]
             elif isinstance(content_data, str) and content_data:
-                results[platform] = self.post_to_platform(platform, content_data)
-
-        return results
+                targets[platform] = content_data
+
+        executor = self.interactive_executor if interactive else self.executor
+        # プロファイリング中はワーカースレッドの処理も計測する
+        dispatch = profiler.wrap(self._dispatch_to_platform)
+        futures = {
+            platform: executor.submit(dispatch, platform, content, media_files, interactive)
+            for platform, content in targets.items()
+        }
+
+        # 呼び出し元のリクエストの処理時間（Server-Timingのhttp）に投稿の待ち時間を含める
+        with timed("http"):
+            return {platform: future.result() for platform, future in futures.items()}
 
 # SNSクライアントのインスタンス
 sns_client = SnsClient()
@@ -0,0 +1,133 @@
+"""投稿内容の文字数の検証
+
+各プラットフォームが実際に数える方法で文字数を数え、投稿前（予約時）に上限を超えた投稿を拒否する。
+
+  X:        URLは23文字、CJKなどは2文字、絵文字は1つで2文字として数える（twitter-text v3の重み付け）
+  Bluesky:  書記素クラスタ（見た目の1文字）で数える。UTF-8で3000バイトまで
+  Mastodon: 書記素クラスタで数え、URLは23文字、リモートのメンション(@user@domain)は@userとして数える
+  Threads・Misskey: コードポイント数で数える
+"""
+import unicodedata
+import regex
+
+# 文字数制限の定義
+CHARACTER_LIMITS = {
+    "bluesky": 300,
+    "x": 280,
+    "threads": 500,
+    "misskey": 3000,
+    "mastodon": 500
+}
+
+BLUESKY_MAX_BYTES = 3000
+
+# X（twitter-text v3）の重み付け：範囲外の文字と絵文字は200、URLは23文字分
+X_WEIGHT_SCALE = 100
+X_DEFAULT_WEIGHT = 200
+X_WEIGHT_RANGES = (
+    (0x0000, 0x10FF, 100),
+    (0x2000, 0x200D, 100),
+    (0x2010, 0x201F, 100),
+    (0x2032, 0x2037, 100),
+)
+URL_LENGTH = 23
+
+# http(s)のURL（末尾の句読点・閉じ括弧はURLに含めない）
+URL_PATTERN = regex.compile(r"https?://[A-Za-z0-9\-._~:/?#\[\]@!$&'()*+,;=%]+(?<![.,:;!?'()\[\]])")
+# 他のサーバーのユーザーへのメンション（Mastodonはドメインを文字数に含めない）
+MASTODON_MENTION_PATTERN = regex.compile(r"(?<![\w/])(@\w+)@[\w.-]+\w", regex.ASCII)
+EMOJI_PATTERN = regex.compile(r"[\p{Extended_Pictographic}\p{Regional_Indicator}⃣]")
+
+
+def count_graphemes(text):
+    """書記素クラスタ（結合文字や絵文字のシーケンスを1文字とした文字）の数を返す"""
+    return len(regex.findall(r"\X", text))
+
+
+def _x_weight(char):
+    code_point = ord(char)
+    for start, end, weight in X_WEIGHT_RANGES:
+        if start <= code_point <= end:
+            return weight
+    return X_DEFAULT_WEIGHT
+
+
+def count_x(text):
+    """Xの重み付き文字数を返す"""
+    text = unicodedata.normalize("NFC", text)
+    weight = 0
+    position = 0
+    for match in URL_PATTERN.finditer(text):
+        weight += _count_x_text(text[position:match.start()]) + URL_LENGTH * X_WEIGHT_SCALE
+        position = match.end()
+    weight += _count_x_text(text[position:])
+    return weight // X_WEIGHT_SCALE
+
+
+def _count_x_text(text):
+    weight = 0
+    for grapheme in regex.findall(r"\X", text):
+        # 絵文字（ZWJシーケンス・肌の色・国旗を含む）は1つで2文字
+        if EMOJI_PATTERN.search(grapheme) and (len(grapheme) > 1 or _x_weight(grapheme) == X_DEFAULT_WEIGHT):
+            weight += X_DEFAULT_WEIGHT
+        else:
+            weight += sum(_x_weight(char) for char in grapheme)
+    return weight
+
+
+def count_mastodon(text):
+    """Mastodonの文字数を返す"""
+    text = MASTODON_MENTION_PATTERN.sub(r"\1", text)
+    return count_graphemes(URL_PATTERN.sub("x" * URL_LENGTH, text))
+
+
+COUNTERS = {
+    "x": count_x,
+    "bluesky": count_graphemes,
+    "mastodon": count_mastodon,
+}
+
+
+def count_characters(platform, text):
+    """プラットフォームの数え方で投稿内容の文字数を返す"""
+    return COUNTERS.get(platform, len)(text or "")
+
+
+def validate_contents(contents, has_media=False):
+    """プラットフォームごとの投稿内容を検証する
+
+    Args:
+        contents: プラットフォーム名をキー、投稿内容を値とする辞書
+        has_media: メディアを添付するか（添付する場合は本文が空でもよい）
+
+    Returns:
+        {platform: {"length", "limit", "valid", "errors"}} の辞書
+    """
+    results = {}
+    for platform, text in contents.items():
+        text = text if isinstance(text, str) else ""
+        errors = []
+        length = count_characters(platform, text)
+        limit = CHARACTER_LIMITS.get(platform)
+
+        if limit is None:
+            errors.append("対応していないプラットフォームです")
+        elif length > limit:
+            errors.append(f"文字数が上限を超えています（{length}/{limit}文字）")
+        if not text.strip() and not has_media:
+            errors.append("投稿内容が空です")
+        if platform == "bluesky" and len(text.encode("utf-8")) > BLUESKY_MAX_BYTES:
+            errors.append(f"投稿内容が{BLUESKY_MAX_BYTES}バイトを超えています")
+
+        results[platform] = {"length": length, "limit": limit, "valid": not errors, "errors": errors}
+    return results
+
+
+def validation_error_message(results):
+    """検証結果のエラーを1つの文字列にまとめる（エラーがない場合はNone）"""
+    messages = [
+        f"{platform}: {error}"
+        for platform, result in results.items()
+        for error in result["errors"]
+    ]
+    return "、".join(messages) if messages else None
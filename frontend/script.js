@@ -9,7 +9,8 @@ const API_URL = {
     POST_WITH_MEDIA: '/api/post-with-media',
     SCHEDULE: '/api/schedule',
     SCHEDULED_POSTS: '/api/scheduled-posts',
-    DELETE_SCHEDULED_POST: '/api/delete-scheduled-post'
+    DELETE_SCHEDULED_POST: '/api/delete-scheduled-post',
+    EVENTS: '/api/events'
 };
 
 // グローバル変数
@@ -45,10 +46,13 @@ document.addEventListener('DOMContentLoaded', function() {
     setupScheduleToggle();
 
     // 予約投稿一覧の更新ボタンのイベントリスナー
-    document.getElementById('refresh-scheduled-posts').addEventListener('click', fetchScheduledPosts);
+    document.getElementById('refresh-scheduled-posts').addEventListener('click', () => fetchScheduledPosts());
 
     // 初期表示時に予約投稿一覧を取得
     fetchScheduledPosts();
+
+    // 予約投稿の変更をサーバーから受け取る
+    subscribeScheduledPostEvents();
 });
 
 // ダークモード初期設定
@@ -449,21 +453,30 @@ function setupScheduleToggle() {
     });
 }
 
+// 予約投稿一覧の次のページのカーソル
+let scheduledPostsNextCursor = null;
+
 // 予約投稿一覧の取得と表示
-async function fetchScheduledPosts() {
+async function fetchScheduledPosts(loadMore = false) {
     try {
         const container = document.getElementById('scheduled-posts-container');
-        container.innerHTML = '<p class="loading">読み込み中...</p>';
+        if (!loadMore) {
+            container.innerHTML = '<p class="loading">読み込み中...</p>';
+        }
 
-        const response = await fetch(API_URL.SCHEDULED_POSTS);
+        const url = loadMore && scheduledPostsNextCursor
+            ? `${API_URL.SCHEDULED_POSTS}?cursor=${encodeURIComponent(scheduledPostsNextCursor)}`
+            : API_URL.SCHEDULED_POSTS;
+        const response = await fetch(url);
         if (!response.ok) {
             throw new Error('予約投稿の取得に失敗しました');
         }
 
         const result = await response.json();
+        scheduledPostsNextCursor = result.next_cursor;
 
         // 予約投稿一覧を表示
-        renderScheduledPosts(result.posts);
+        renderScheduledPosts(result.posts, loadMore);
 
     } catch (error) {
         document.getElementById('scheduled-posts-container').innerHTML =
@@ -472,13 +485,20 @@ async function fetchScheduledPosts() {
 }
 
 // 予約投稿一覧の表示
-function renderScheduledPosts(posts) {
+function renderScheduledPosts(posts, append = false) {
     const container = document.getElementById('scheduled-posts-container');
-    container.innerHTML = '';
+    if (append) {
+        const loadMoreButton = container.querySelector('.load-more-scheduled-posts');
+        if (loadMoreButton) {
+            loadMoreButton.remove();
+        }
+    } else {
+        container.innerHTML = '';
+    }
 
     console.log('受け取った予約投稿:', posts); // デバッグ用ログ
 
-    if (!posts || posts.length === 0) {
+    if (!append && (!posts || posts.length === 0)) {
         container.innerHTML = '<p class="no-scheduled-posts">予約済みの投稿はありません</p>';
         return;
     }
@@ -548,19 +568,15 @@ function renderScheduledPosts(posts) {
             contentText = '内容の読み込みエラー';
         }
 
-        // 投稿ステータスに応じたクラス
-        const statusClass = post.status === 'completed' ? 'completed' :
-                           post.status === 'failed' ? 'failed' : 'pending';
-
-        // 投稿ステータスの日本語表示
-        const statusText = post.status === 'completed' ? '完了' :
-                          post.status === 'failed' ? '失敗' : '待機中';
+        // 投稿ステータスに応じたクラスと日本語表示
+        const { statusClass, statusText } = scheduledStatusView(post.status);
 
         // メディア情報（あれば）
         const hasMedia = post.media_paths && post.media_paths.files && post.media_paths.files.length > 0;
 
         const postItem = document.createElement('div');
         postItem.className = `scheduled-post-item ${statusClass}`;
+        postItem.dataset.postId = post.id;
         postItem.innerHTML = `
             <div class="scheduled-post-header">
                 <div class="scheduled-time">${formattedDate}</div>
@@ -579,13 +595,24 @@ function renderScheduledPosts(posts) {
         container.appendChild(postItem);
     });
 
+    // 次のページがある場合は「もっと見る」ボタンを表示
+    if (scheduledPostsNextCursor) {
+        const loadMoreButton = document.createElement('button');
+        loadMoreButton.className = 'refresh-button load-more-scheduled-posts';
+        loadMoreButton.textContent = 'もっと見る';
+        loadMoreButton.addEventListener('click', () => fetchScheduledPosts(true));
+        container.appendChild(loadMoreButton);
+    }
+
     // 削除ボタンのイベントリスナーを設定
-    document.querySelectorAll('.delete-scheduled-post').forEach(button => {
+    container.querySelectorAll('.delete-scheduled-post:not([data-bound])').forEach(button => {
+        button.dataset.bound = 'true';
         button.addEventListener('click', async function() {
             if (confirm('この予約投稿を削除してもよろしいですか？')) {
                 const postId = this.dataset.id;
-                await deleteScheduledPost(postId);
-                fetchScheduledPosts(); // 一覧を更新
+                if (await deleteScheduledPost(postId)) {
+                    removeScheduledPostItem(postId);
+                }
             }
         });
     });
@@ -603,10 +630,86 @@ async function deleteScheduledPost(postId) {
         }
 
         showSuccess('予約投稿を削除しました');
+        return true;
 
     } catch (error) {
         showError('予約投稿の削除に失敗しました: ' + error.message);
+        return false;
+    }
+}
+
+// 投稿ステータスに応じたクラスと日本語表示
+function scheduledStatusView(status) {
+    const statusClass = status === 'completed' ? 'completed' :
+                        status === 'failed' ? 'failed' : 'pending';
+    const statusText = status === 'completed' ? '完了' :
+                       status === 'failed' ? '失敗' :
+                       status === 'processing' ? '投稿中' :
+                       status === 'retrying' ? '再試行待ち' : '待機中';
+    return { statusClass, statusText };
+}
+
+// 表示中の予約投稿のステータスを更新
+function updateScheduledPostStatus(postId, status) {
+    const postItem = document.querySelector(`.scheduled-post-item[data-post-id="${postId}"]`);
+    if (!postItem) {
+        return;
     }
+    const { statusClass, statusText } = scheduledStatusView(status);
+    postItem.className = `scheduled-post-item ${statusClass}`;
+    const statusElement = postItem.querySelector('.scheduled-status');
+    statusElement.className = `scheduled-status ${statusClass}`;
+    statusElement.textContent = statusText;
+}
+
+// 表示中の予約投稿を一覧から取り除く
+function removeScheduledPostItem(postId) {
+    const postItem = document.querySelector(`.scheduled-post-item[data-post-id="${postId}"]`);
+    if (postItem) {
+        postItem.remove();
+    }
+    const container = document.getElementById('scheduled-posts-container');
+    if (!container.querySelector('.scheduled-post-item') && !scheduledPostsNextCursor) {
+        container.innerHTML = '<p class="no-scheduled-posts">予約済みの投稿はありません</p>';
+    }
+}
+
+// 予約投稿の変更イベント（Server-Sent Events）の購読
+let scheduledPostEvents = null;
+let scheduledPostsRefreshTimer = null;
+
+// 短時間に続いたイベントでは一覧の再取得を1回にまとめる
+function refreshScheduledPostsSoon() {
+    clearTimeout(scheduledPostsRefreshTimer);
+    scheduledPostsRefreshTimer = setTimeout(() => fetchScheduledPosts(), 500);
+}
+
+function subscribeScheduledPostEvents() {
+    if (!window.EventSource) {
+        return;
+    }
+
+    scheduledPostEvents = new EventSource(API_URL.EVENTS);
+
+    // 一覧に影響する追加・変更は再取得し、ステータスの変化は表示中の項目だけを更新する
+    ['post_created', 'posts_created', 'post_updated', 'resync'].forEach(type => {
+        scheduledPostEvents.addEventListener(type, refreshScheduledPostsSoon);
+    });
+    scheduledPostEvents.addEventListener('post_claimed', event => {
+        updateScheduledPostStatus(JSON.parse(event.data).id, 'processing');
+    });
+    scheduledPostEvents.addEventListener('post_status', event => {
+        const data = JSON.parse(event.data);
+        updateScheduledPostStatus(data.id, data.status);
+    });
+    scheduledPostEvents.addEventListener('post_deleted', event => {
+        removeScheduledPostItem(JSON.parse(event.data).id);
+    });
+}
+
+// イベントを受信できている場合は一覧の再取得を省略できる
+function scheduledPostEventsConnected() {
+    return scheduledPostEvents !== null && scheduledPostEvents.readyState === EventSource.OPEN;
 }
 
 // 投稿処理
@@ -697,7 +800,9 @@ async function handlePost() {
 
             const result = await response.json();
             showSuccess('投稿が予約されました');
-            fetchScheduledPosts();  // 予約投稿一覧を更新
+            if (!scheduledPostEventsConnected()) {
+                fetchScheduledPosts();  // 予約投稿一覧を更新
+            }
         } else {
             showProcessingStatus('SNSに投稿中...');
             // 即時投稿の場合